@@ -0,0 +1,295 @@
+"""
+Benchmarks shared/intcode.py on the stored puzzle programs.
+
+Run from the repository root, like the day scripts:
+    python bench/bench_intcode.py                      # every scenario, every engine
+    python bench/bench_intcode.py day9-part2 day13-part2 --engines interpreter compiled
+    python bench/bench_intcode.py --repeat 5 --json    # one JSON line per measurement
+
+For each (scenario, engine) it reports the best wall time of --repeat runs,
+instructions per second (the instruction count comes from one profiled run
+of the scenario) and the peak memory allocated while running it once under
+tracemalloc. Results of every engine are checked against the first one.
+"""
+import argparse
+import itertools
+import json
+import queue
+import sys, os, time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from shared.intcode import IntcodeVM, Processor
+from shared.compiler import CompiledVM
+from shared.memory import PagedMemory, CompactMemory
+try:
+    from shared.lockstep import run_lockstep
+except ImportError:  # numpy is optional
+    run_lockstep = None
+
+# name -> (VM class, memory class)
+ENGINES = {
+    'interpreter': (IntcodeVM, PagedMemory),
+    'compiled': (CompiledVM, PagedMemory),
+    'compact': (IntcodeVM, CompactMemory),
+}
+
+
+class Bench(object):
+    """ Creates and runs the VMs of one scenario run, for one engine. """
+    def __init__(self, program, engine, memory, profile=False):
+        self.base = memory(program)
+        self.engine = engine
+        self.profile = profile
+        self.instructions = 0
+
+    def vm(self, patch=None, input=None, output=None):
+        memory = self.base.fork()
+        for address, value in (patch or {}).items():
+            memory[address] = value
+        return self.engine(memory, input=input, output=output, profile=self.profile)
+
+    def count(self, vm):
+        if vm.profiler is not None:
+            self.instructions += sum(vm.profiler.opcodes.values())
+
+    def run(self, patch=None, input=None, output=None):
+        vm = self.vm(patch=patch, input=input, output=output)
+        vm.run()
+        self.count(vm)
+        return vm
+
+
+class Arcade(object):
+    """
+    Headless day13 cabinet: the game's output port (the screen)
+    and its input port (a joystick that follows the ball).
+    """
+    def __init__(self):
+        self.pending = []
+        self.ball = 0
+        self.paddle = 0
+        self.score = 0
+
+    def append(self, value):
+        self.pending.append(value)
+        if len(self.pending) == 3:
+            x, y, tile = self.pending
+            self.pending = []
+            if (x, y) == (-1, 0):
+                self.score = tile
+            elif tile == 3:  # paddle
+                self.paddle = x
+            elif tile == 4:  # ball
+                self.ball = x
+
+    def get(self):
+        return (self.ball > self.paddle) - (self.ball < self.paddle)
+
+
+# Scenarios.
+# Each one runs a puzzle workload through `bench` and returns its answer.
+
+def day2_sweep(bench):
+    for noun in range(0, 100):
+        for verb in range(0, 100):
+            vm = bench.run(patch={1: noun, 2: verb})
+            if vm.memory[0] == 19690720:
+                return 100 * noun + verb
+
+
+def day2_lockstep(bench):
+    jobs = [({1: noun, 2: verb}, None) for noun in range(0, 100) for verb in range(0, 100)]
+    for (patch, _), result in zip(jobs, run_lockstep(list(bench.base), jobs, engine=bench.engine)):
+        if result["memory"][0] == 19690720:
+            return 100 * patch[1] + patch[2]
+
+
+def diagnostic(system_id):
+    def scenario(bench):
+        output = []
+        bench.run(input=[system_id], output=output)
+        return output
+    return scenario
+
+
+def day7_chain(bench):
+    best = None
+    for phase_seq in itertools.permutations(range(0, 5)):
+        signal = 0
+        for phase in phase_seq:
+            output = []
+            bench.run(input=[phase, signal], output=output)
+            signal = output.pop()
+        best = signal if best is None else max(best, signal)
+    return best
+
+
+def day7_lockstep(bench):
+    # one lockstep batch per amplifier, across all 120 phase sequences
+    phase_seqs = list(itertools.permutations(range(0, 5)))
+    signals = [0] * len(phase_seqs)
+    for amp in range(5):
+        jobs = [(None, [phase_seq[amp], signal]) for phase_seq, signal in zip(phase_seqs, signals)]
+        signals = [result["output"][-1] for result in run_lockstep(list(bench.base), jobs, engine=bench.engine)]
+    return max(signals)
+
+
+def day7_feedback(bench):
+    best = None
+    for phase_seq in itertools.permutations(range(5, 10)):
+        wires = [queue.Queue() for _ in phase_seq]
+        for wire, phase in zip(wires, phase_seq):
+            wire.put(phase)
+        wires[0].put(0)
+        amps = []
+        for i in range(len(phase_seq)):
+            # E writes straight into A's input, no connector needed
+            amps.append(Processor(i, bench.base,
+                in_wire=wires[i], out_wire=wires[(i + 1) % len(wires)],
+                engine=bench.engine, profile=bench.profile))
+        for amp in amps:
+            amp.start()
+        for amp in amps:
+            amp.join()
+            bench.count(amp.vm)
+        signal = wires[0].get()
+        best = signal if best is None else max(best, signal)
+    return best
+
+
+def day13_screen(bench):
+    screen = []
+    bench.run(output=screen)
+    return screen[2::3].count(2)  # block tiles
+
+
+def day13_game(bench):
+    arcade = Arcade()
+    bench.run(patch={0: 2}, input=arcade, output=arcade)
+    return arcade.score
+
+
+def day17_camera(bench):
+    feed = []
+    bench.run(output=feed)
+    return len(feed)
+
+
+# Movement routine for the program in day17/input, as found by day17.py
+DAY17_ROUTINE = 'A,B,A,B,C,C,B,A,B,C\nL,4,R,8,L,6,L,10\nL,6,R,8,R,10,L,6,L,6\nL,4,L,4,L,10\nn\n'
+
+def day17_vacuum(bench):
+    feed = []
+    bench.run(patch={0: 2}, input=[ord(c) for c in DAY17_ROUTINE], output=feed)
+    return feed[-1]
+
+
+# name -> (program, scenario)
+SCENARIOS = {
+    'day2-sweep': ('./day2/input', day2_sweep),
+    'day5-part1': ('./day5/input', diagnostic(1)),
+    'day5-part2': ('./day5/input', diagnostic(5)),
+    'day7-part1': ('./day7/input', day7_chain),
+    'day7-part2': ('./day7/input', day7_feedback),
+    'day9-part1': ('./day9/input', diagnostic(1)),
+    'day9-part2': ('./day9/input', diagnostic(2)),
+    'day13-part1': ('./day13/input', day13_screen),
+    'day13-part2': ('./day13/input', day13_game),
+    'day17-part1': ('./day17/input', day17_camera),
+    'day17-part2': ('./day17/input', day17_vacuum),
+}
+if run_lockstep is not None:
+    SCENARIOS.update({
+        'day2-lockstep': ('./day2/input', day2_lockstep),
+        'day7-lockstep': ('./day7/input', day7_lockstep),
+    })
+
+
+def load(path):
+    with open(path) as input:
+        return [int(x) for x in input.readline().split(',')]
+
+
+def measure(program, scenario, engine, repeat=3):
+    vm_class, memory_class = ENGINES[engine]
+
+    wall = None
+    for _ in range(repeat):
+        bench = Bench(program, vm_class, memory_class)
+        start = time.perf_counter()
+        answer = scenario(bench)
+        elapsed = time.perf_counter() - start
+        wall = elapsed if wall is None else min(wall, elapsed)
+
+    tracemalloc.start()
+    scenario(Bench(program, vm_class, memory_class))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "answer": answer,
+        "wall": wall,
+        "peak": peak,
+    }
+
+
+def count_instructions(program, scenario):
+    bench = Bench(program, IntcodeVM, PagedMemory, profile=True)
+    scenario(bench)
+    return bench.instructions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Intcode benchmarks')
+    parser.add_argument('scenarios', nargs='*',
+                        help='scenarios to run (default: all): ' + ', '.join(SCENARIOS))
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per measurement; best one is kept')
+    parser.add_argument('--json', action='store_true', help='print one JSON line per measurement')
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario: {}'.format(name))
+
+    if not args.json:
+        print('{:<14} {:<12} {:>10} {:>14} {:>12}  {}'.format(
+            'scenario', 'engine', 'wall (s)', 'instr/s', 'peak (KiB)', 'answer'))
+
+    failed = False
+    for name in args.scenarios or list(SCENARIOS):
+        path, scenario = SCENARIOS[name]
+        program = load(path)
+        instructions = count_instructions(program, scenario)
+
+        expected = None
+        for engine in args.engines:
+            result = measure(program, scenario, engine, repeat=args.repeat)
+            if expected is None:
+                expected = result["answer"]
+            mismatch = result["answer"] != expected
+            failed = failed or mismatch
+
+            row = {
+                "scenario": name,
+                "engine": engine,
+                "wall": result["wall"],
+                "instructions": instructions,
+                # lockstep scenarios bypass the profiler, so they count no instructions
+                "ips": instructions / result["wall"] if instructions and result["wall"] else None,
+                "peak": result["peak"],
+                "answer": result["answer"],
+                "mismatch": mismatch,
+            }
+            if args.json:
+                print(json.dumps(row))
+            else:
+                print('{scenario:<14} {engine:<12} {wall:>10.4f} {ips_text:>14} {peak_kib:>12,.1f}  {answer}{flag}'.format(
+                    ips_text='-' if row["ips"] is None else '{:,.0f}'.format(row["ips"]),
+                    peak_kib=row["peak"] / 1024,
+                    flag='  MISMATCH' if mismatch else '',
+                    **row))
+
+    if failed:
+        print("ERROR: engines disagree.")
+        sys.exit(1)
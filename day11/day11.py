@@ -1,14 +1,15 @@
-import queue
 import sys, os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from shared.coord import Coord
-from shared.intcode import intcode, Processor, Connector
+from shared.intcode import intcode, IntcodeVM, Processor, Connector, HALTED
+from shared.image import load_program
+from shared.wire import Wire
 
 
-def create_robot_brain(code, debug=False):
-    input_from_camera = queue.Queue()
-    output_instructions = queue.Queue()
+def create_robot_brain(code, debug=False, capacity=None):
+    input_from_camera = Wire(capacity=capacity)
+    output_instructions = Wire(capacity=capacity)
     brain = Processor('brain', code,
         in_wire=input_from_camera, out_wire=output_instructions, debug=debug)
     return (brain, input_from_camera, output_instructions)
@@ -130,8 +131,8 @@ class RobotMover(Connector):
         self.out_wire.put(curr_color)
 
 
-def create_robot(code, grid, debug=False):
-    brain, brain_in, brain_out = create_robot_brain(code)
+def create_robot(code, grid, debug=False, capacity=None):
+    brain, brain_in, brain_out = create_robot_brain(code, capacity=capacity)
     mover = RobotMover(
         id='robot-mover',
         grid=grid,
@@ -154,8 +155,7 @@ def run_robot(robot, debug=False):
     # initial read from camera
     brain_in.put(mover.grid.get_color(mover.pos))
 
-    chips['brain'].add_listener( mover.disconnect )
-
+    # the mover stops once the brain halts and it has drained the brain's output
     for th in list(chips.values()) + list(wires):
         if debug:
             print("WAITING ON: {}".format(th))
@@ -164,6 +164,23 @@ def run_robot(robot, debug=False):
             print("TERMINATED: {}".format(th))
 
 
+def paint(code, grid, pos=Coord(0,0), dir=Directions.NORTH, debug=False):
+    """
+    Runs the robot in the calling thread: the brain hands control back
+    on every camera read and instruction, no threads or wires involved.
+    """
+    brain = IntcodeVM(code, id='brain', debug=debug)
+    io = brain.execute()
+    event, _ = next(io)
+    while event != HALTED:
+        # camera read, then paint color and turn direction
+        _, color = io.send(grid.get_color(pos))
+        _, direction = next(io)
+        grid[pos] = color
+        pos, dir = move(pos, dir, direction == 0)
+        event, _ = next(io)
+
+
 def print_grid(grid):
     xMin, xMax = None, None
     yMin, yMax = None, None
@@ -199,13 +216,11 @@ def run_tests():
 if __name__ == '__main__':
 
     print("Reading input..")
-    with open('./day11/input') as input:
-        initMemory = [int(x) for x in input.readline().split(',')]
+    initMemory = load_program('./day11/input')
 
     grid = PaintGrid()
     grid[Coord(0,0)] = PaintGrid.WHITE
-    robot = create_robot(initMemory, grid, debug=False)
-    run_robot(robot, debug=False)
+    paint(initMemory, grid, debug=False)
 
     # print('PaintGrid End State: {}'.format(grid))
     print('PaintGrid Size: {}'.format(len(grid)))
@@ -1,9 +1,13 @@
-import sys, os, queue
-import itertools, time
+import sys, os
+import itertools, tempfile, time
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from shared.checkpoint import save_checkpoint, load_checkpoint
 from shared.coord import Coord
-from shared.intcode import intcode, Processor, Connector
+from shared.intcode import intcode, IntcodeVM, Processor, Connector, NEEDS_INPUT, HALTED
+from shared.image import load_program
+from shared.ports import CallbackPort
+from shared.wire import Wire
 
 # Tile types
 EMPTY = 0
@@ -16,6 +20,11 @@ JOYSTICK_NEUTRAL = 0
 JOYSTICK_TILT_LEFT = -1
 JOYSTICK_TILT_RIGHT = 1
 
+# Where the game in ./day13/input keeps its state
+SCORE_ADDRESS = 386
+BALL_X_ADDRESS = 388
+PADDLE_X_ADDRESS = 392
+
 class DisplayGrid(dict):
     def __init__(self):
         self.tiles = {}
@@ -80,7 +89,9 @@ class GameController(Connector):
         posX = self.in_wire.get()
         posY = self.in_wire.get()
         third = self.in_wire.get()
+        self.update(posX, posY, third)
 
+    def update(self, posX, posY, third):
         pos = Coord(posX, posY)
         if pos == Coord(-1, 0):  # third is "score"
             if self.debug:
@@ -138,9 +149,10 @@ class GameController(Connector):
                             )
                     
 
-def create_game(code, debug=False):
+def create_game(code, debug=False, capacity=None):
+    """ With a capacity, the game waits for the display to catch up instead of buffering frames. """
     joystick = Joystick(debug=debug)
-    output_display = queue.Queue()
+    output_display = Wire(capacity=capacity)
     game = Processor('game', code,
         in_wire=joystick,
         out_wire=output_display,
@@ -149,8 +161,8 @@ def create_game(code, debug=False):
     return (game, joystick, output_display)
 
 
-def create_arcage(code, grid, debug=False):
-    game, joystick, output_display = create_game(code, debug=debug)
+def create_arcage(code, grid, debug=False, capacity=None):
+    game, joystick, output_display = create_game(code, debug=debug, capacity=capacity)
     controller = GameController(
         id='game-controller',
         grid=grid,
@@ -171,8 +183,7 @@ def run_arcade(arcade, debug=False):
     for th in list(chips.values()) + list(wires):
         th.start()
 
-    chips['game'].add_listener( controller.disconnect )
-
+    # the controller stops once the game halts and it has drawn the last frame
     for th in list(chips.values()) + list(wires):
         if debug:
             print("WAITING ON: {}".format(th))
@@ -181,20 +192,121 @@ def run_arcade(arcade, debug=False):
             print("TERMINATED: {}".format(th))
 
 
+def play(code, grid, debug=False):
+    """
+    Runs the arcade in the calling thread: the game hands control back
+    on every joystick read and display update, no threads or wires involved.
+    Returns the controller, which holds the score.
+    """
+    joystick = Joystick(debug=debug)
+    controller = GameController(
+        id='game-controller',
+        grid=grid,
+        joystick=joystick,
+        debug=debug
+    )
+    game = IntcodeVM(code, id='game', debug=debug)
+    io = game.execute()
+    display = []
+    event, value = next(io)
+    while event != HALTED:
+        if event == NEEDS_INPUT:
+            event, value = io.send(joystick.state)
+            continue
+
+        display.append(value)
+        if len(display) == 3:
+            controller.update(*display)
+            display = []
+        event, value = next(io)
+    return controller
+
+
+class WatchingController(object):
+    """
+    Plays the game by watching its memory instead of decoding the display:
+    the ball, the paddle and the score are picked up as the game writes them,
+    and the joystick just follows the ball.
+    """
+    def __init__(self, game, debug=False):
+        self.debug = debug
+        self.score = game.memory[SCORE_ADDRESS]
+        self.ball_x = game.memory[BALL_X_ADDRESS]
+        self.paddle_x = game.memory[PADDLE_X_ADDRESS]
+        game.watch(SCORE_ADDRESS, PADDLE_X_ADDRESS + 1, self.written)
+
+    def written(self, address, old, new):
+        if address == SCORE_ADDRESS:
+            self.score = new
+        elif address == BALL_X_ADDRESS:
+            self.ball_x = new
+        elif address == PADDLE_X_ADDRESS:
+            self.paddle_x = new
+        else:
+            return
+        if self.debug:
+            print('WatchingController: [{}] {} -> {}'.format(address, old, new))
+
+    def joystick(self):
+        if self.paddle_x > self.ball_x:
+            return JOYSTICK_TILT_LEFT
+        if self.paddle_x < self.ball_x:
+            return JOYSTICK_TILT_RIGHT
+        return JOYSTICK_NEUTRAL
+
+
+def play_watched(code, debug=False, checkpoint=None):
+    """
+    Runs the game with a WatchingController at the joystick; the display
+    output is thrown away. Returns the controller, which holds the score.
+    With a `checkpoint` path, the game carries on from the VM saved there.
+    """
+    port = CallbackPort(get=lambda: controller.joystick(), put=lambda value: None)
+    if checkpoint is None:
+        game = IntcodeVM(code, input=port, output=port, id='game', debug=debug)
+    else:
+        game = load_checkpoint(checkpoint, input=port, output=port, id='game', debug=debug)
+    controller = WatchingController(game, debug=debug)
+    game.run()
+    return controller
+
+
+def pause_game(code, moves, checkpoint):
+    """ Plays `moves` joystick moves, then saves the game to `checkpoint`. """
+    game = IntcodeVM(code, id='game')
+    controller = WatchingController(game)
+    io = game.execute()
+    event, value = next(io)
+    while moves and event != HALTED:
+        if event == NEEDS_INPUT:
+            moves -= 1
+            event, value = io.send(controller.joystick())
+        else:
+            event, value = next(io)
+    io.close()  # leaves the game on its next joystick read
+    save_checkpoint(game, checkpoint)
+
+
 def run_tests():
-    pass
+    code = load_program('./day13/input')
+    code[0] = 2
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, 'game')
+        pause_game(code, 1000, checkpoint)
+        score = play_watched(code, checkpoint=checkpoint).score
+    if score != play_watched(code).score:
+        print("[A] Resumed game ended with a different score: {}".format(score))
+        sys.exit(1)
 
 if __name__ == '__main__':
     run_tests()
     print("Part #1")
 
     print("Reading input..")
-    with open('./day13/input') as input:
-        initMemory = [int(x) for x in input.readline().split(',')]
+    initMemory = load_program('./day13/input')
 
     grid = DisplayGrid()
-    arcade = create_arcage(initMemory, grid, debug=False)
-    run_arcade(arcade, debug=False)
+    play(initMemory, grid, debug=False)
 
     print('DisplayGrid Size: {}'.format(len(grid)))
     print('Number of "block" tiles: {}'.format( grid.numBlocks() ))
@@ -205,10 +317,10 @@ if __name__ == '__main__':
     print("Playing game..")
 
     grid = DisplayGrid()
-    arcade = create_arcage(initMemory, grid, debug=False)
-    run_arcade(arcade, debug=False)
+    controller = play(initMemory, grid, debug=False)
 
-    (_, wires,_, _) = arcade
-    (controller, ) = wires
     print('Current Score: {}'.format( controller.score ))
-    print('Number of "block" tiles: {}'.format( grid.numBlocks() ))
\ No newline at end of file
+    print('Number of "block" tiles: {}'.format( grid.numBlocks() ))
+
+    print("Playing game off its memory..")
+    print('Current Score: {}'.format( play_watched(initMemory).score ))
\ No newline at end of file
@@ -1,14 +1,16 @@
-import queue
 import sys, os
+from collections import deque
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from shared.coord import Coord
-from shared.intcode import intcode, Processor, Connector
+from shared.intcode import intcode, IntcodeVM, Processor, Connector
+from shared.image import load_program
+from shared.wire import Wire
 
 
-def create_droid(code, debug=False):
-    move_inst = queue.Queue()
-    move_status = queue.Queue()
+def create_droid(code, debug=False, capacity=None):
+    move_inst = Wire(capacity=capacity)
+    move_status = Wire(capacity=capacity)
     droid = Processor('droid', code,
         in_wire=move_inst, out_wire=move_status, debug=debug)
     return (droid, move_inst, move_status)
@@ -131,6 +133,7 @@ class DroidController(Connector):
         super(DroidController, self).__init__(id,
             in_wire=in_wire, out_wire=out_wire, debug=debug)
         self.grid = grid
+        self.droid = droid
         self.pos = pos
 
     def __str__(self):
@@ -141,7 +144,7 @@ class DroidController(Connector):
 
         dir = self.grid.select_direction(self.pos)
         if dir == Directions.STOP:
-            Processor.abort()
+            self.droid.abort()
             self.out_wire.put(Directions.NORTH)  # anything
             self.disconnect()
             return
@@ -170,8 +173,8 @@ class DroidController(Connector):
 
 
 
-def create_droid_with_controller(code, grid, debug=False):
-    droid, move_inst, move_status = create_droid(code)
+def create_droid_with_controller(code, grid, debug=False, capacity=None):
+    droid, move_inst, move_status = create_droid(code, capacity=capacity)
     controller = DroidController(
         id='robot-mover',
         grid=grid, droid=droid,
@@ -204,6 +207,43 @@ def run_robot(robot, debug=False):
             print("TERMINATED: {}".format(th))
 
 
+def move_droid(droid, dir):
+    """
+    Forks the droid, sends the fork one step in `dir`,
+    and returns (status, fork). The original droid does not move.
+    """
+    moved = droid.fork()
+    io = moved.execute()
+    next(io)  # waits for a movement command
+    _, status = io.send(dir.code)
+    return status, moved
+
+
+def explore(code, debug=False):
+    """
+    Maps the maze breadth-first, forking the droid at every open cell
+    instead of walking a single droid around.
+    """
+    grid = MazeGrid()
+    start = Coord(0,0)
+    grid[start] = MazeGrid.OPEN
+
+    frontier = deque([(start, IntcodeVM(code, id='droid'))])
+    while frontier:
+        pos, droid = frontier.popleft()
+        for dir in [Directions.NORTH, Directions.WEST, Directions.SOUTH, Directions.EAST]:
+            next_pos = pos + dir.step
+            if next_pos in grid:
+                continue
+            status, moved = move_droid(droid, dir)
+            if debug:
+                print('explore(): {pos} -> {dir}: {status}'.format(**locals()))
+            grid[next_pos] = status
+            if status != MazeGrid.BLOCKED:
+                frontier.append((next_pos, moved))
+    return grid
+
+
 def print_grid(grid, droid_pos):
     os.system('clear')
     xMin, xMax = None, None
@@ -244,15 +284,10 @@ def run_tests():
 if __name__ == '__main__':
 
     print("Reading input..")
-    with open('./day15/input') as input:
-        initMemory = [int(x) for x in input.readline().split(',')]
+    initMemory = load_program('./day15/input')
 
-    grid = MazeGrid()
     start = Coord(0,0)
-    grid[start] = MazeGrid.OPEN
-    grid.track(start)
-    robot = create_droid_with_controller(initMemory, grid, debug=False)
-    run_robot(robot, debug=False)
+    grid = explore(initMemory)
 
     print('MazeGrid Size: {}'.format(len(grid)))
 
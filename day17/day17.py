@@ -1,8 +1,12 @@
-import sys, os, time, datetime, queue
+import sys, os, io, time, datetime
+from contextlib import redirect_stdout, redirect_stderr
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from shared.coord import Coord
 from shared.intcode import intcode, Processor, Connector
+from shared.image import load_program
+from shared.ports import AsciiPort
+from shared.wire import Wire, WireClosed
 
 
 GRID = {
@@ -16,6 +20,9 @@ GRID = {
     ord('X'): 'X',
 }
 
+# characters the camera may get ahead of whoever reads its feed
+CAMERA_CAPACITY = 64
+
 
 class Direction(object):
     def __init__(self, id, step):
@@ -46,33 +53,72 @@ def isBot(ch):
     return ch == '<' or ch == '^' or ch == '>' or ch == 'v'
 
 
-def create_controller(code, debug=False):
-    robot_inst = queue.Queue()
-    camera_feed = [] # queue.Queue()
+def create_controller(code, debug=False, capacity=None):
+    """
+    The camera feed is a Wire to read from while the program runs; with a
+    capacity, the program pauses whenever that many characters are unread.
+    """
+    robot_inst = Wire()
+    camera_feed = Wire(capacity=capacity)
     controller = Processor('ascii', code,
         in_wire=robot_inst, out_wire=camera_feed, debug=debug)
     return (controller, robot_inst, camera_feed)
 
 
-def create_unit_with_controller(code, debug=False):
-    controller, robot_inst, camera_feed = create_controller(code, debug=debug)
+def create_unit_with_controller(code, debug=False, capacity=None):
+    controller, robot_inst, camera_feed = create_controller(code, debug=debug, capacity=capacity)
     chips = { 'ascii': controller }
     wires = ()
     return (chips, wires, robot_inst, camera_feed)
 
 
+def read_grid(camera_feed):
+    """
+    Builds the scaffold grid from the camera feed as it arrives, until the
+    program halts and closes the feed. Returns (grid, width, height).
+    """
+    grid = dict()
+    x, y = 0, 0
+    X = 0
+    while True:
+        try:
+            f = camera_feed.get()
+        except WireClosed:
+            break
+        ch = GRID[f]
+        if ch == 'EOL':
+            if y == 0:
+                X = x
+
+            y += 1
+            x = 0
+        else:
+            pos = Coord(x, y)
+            grid[pos] = ch
+            x += 1
+    return grid, X, y-1
+
+
 def run_unit(unit, debug=False):
-    (chips, wires, _, _) = unit
+    """ Runs the unit, reading its camera feed while it does; returns read_grid()'s result. """
+    (chips, wires, _, camera_feed) = unit
 
     for th in list(chips.values()) + list(wires):
         th.start()
 
+    # a bounded feed only drains if someone reads it while the program runs
+    scaffold = read_grid(camera_feed)
+
     for th in list(chips.values()) + list(wires):
         if debug:
             print("WAITING ON: {}".format(th))
         th.join()
         if debug:
             print("TERMINATED: {}".format(th))
+    for chip in chips.values():
+        if chip.error is not None:
+            raise Exception("{} crashed".format(chip)) from chip.error
+    return scaffold
     
 
 def print_grid(grid, droid_pos):
@@ -218,32 +264,29 @@ def factorizeSteps(steps, segments=None, debug=False):
     return False, None
 
 
+def run_tests():
+    # a crash must close the camera feed and raise, not leave read_grid() waiting
+    unit = create_unit_with_controller([104, 35, 104, 10, 77, 0, 99], capacity=CAMERA_CAPACITY)
+    try:
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            run_unit(unit)
+    except Exception:
+        pass
+    else:
+        print("[C] Crashing program did not raise")
+        sys.exit(1)
+
+
 if __name__ == '__main__':
+    run_tests()
     print('Day 17')
 
     print("Reading input..")
-    with open('./day17/input') as input:
-        initMemory = [int(x) for x in input.readline().split(',')]
-
-    feed = []
-    intcode(initMemory, input=None, output=feed, debug=False)
+    initMemory = load_program('./day17/input')
 
-    grid = dict()
-    x, y = 0, 0
-    X, Y = 0, 0
-    for f in feed:
-        ch = GRID[f]
-        if ch == 'EOL':
-            if y == 0:
-                X = x
-            
-            y += 1
-            x = 0
-        else:
-            pos = Coord(x, y)
-            grid[pos] = ch
-            x += 1
-    Y = y-1
+    # the grid is built as the camera sends it, never holding more than a line or so unread
+    unit = create_unit_with_controller(initMemory, capacity=CAMERA_CAPACITY)
+    grid, X, Y = run_unit(unit)
 
     print(X, Y)
 
@@ -318,11 +361,8 @@ if __name__ == '__main__':
     valid, fs = factorizeSteps(steps)
     print("FactorizedSteps: {}, {}".format(valid, fs))
 
-    with open('./day17/input') as input:
-        initMemory = [int(x) for x in input.readline().split(',')]
-
     initMemory[0] = 2
-    feed = []
-    data = [ord(i) for i in fs[0] + '\n' + fs[1] + '\n' + fs[2] + '\n' + fs[3] + '\n' + 'n' + '\n']
-    intcode(initMemory, input=data, output=feed, debug=False)
-    print("Part 2: Answer =", feed[-1])
+    # main routine, functions A, B and C, then 'n' for no video feed
+    port = AsciiPort(fs + ['n'])
+    intcode(initMemory, input=port, output=port, debug=False)
+    print("Part 2: Answer =", port.values[-1])
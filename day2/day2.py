@@ -3,6 +3,8 @@ import sys, os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from shared.intcode import intcode
+from shared.image import load_program
+from shared.symbolic import find_inputs
 
 if __name__ == '__main__':
 
@@ -21,8 +23,7 @@ if __name__ == '__main__':
             sys.exit(1)
 
 
-    with open('./day2/input') as input:
-        initMemory = [int(x) for x in input.readline().split(',')]
+    initMemory = load_program('./day2/input')
 
     # part 1
     print("# Part 1")
@@ -36,27 +37,11 @@ if __name__ == '__main__':
     # part 2
     print("# Part 2")
     target = 19690720
-    found = False
-    for noun in range(0, 100):
-        for verb in range(0, 100):
-
-            # init memory
-            memory = initMemory.copy()
-
-            # inputs
-            memory[1] = noun
-            memory[2] = verb
-            endState = intcode(memory)
-            output = endState["memory"][0]
-            
-            if output == target:
-                found = True
-                break # for verb
-        if found:
-            break # for noun
+    # noun and verb go in memory[1] and memory[2]
+    inputs = find_inputs(initMemory, {1: range(0, 100), 2: range(0, 100)}, target)
     
-    if found:
+    if inputs is not None:
+        noun, verb = inputs[1], inputs[2]
         print("noun = {}, verb = {}, result = {}".format(noun, verb, 100 * noun + verb))
     else:
         print("ERROR: Could not find match.")
-
@@ -3,6 +3,8 @@ import sys, os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from shared.intcode import intcode
+from shared.image import load_program
+from shared.memo import RunCache
 
 
 if __name__ == '__main__':
@@ -96,14 +98,14 @@ if __name__ == '__main__':
                     print("Test Run of {} (input {}) = {}. Expected: {}".format(initMemory, inp, output, expectedOutput))
                     sys.exit(1)
 
-    with open('./day5/input') as input:
-        initMemory = [int(x) for x in input.readline().split(',')]
+    initMemory = load_program('./day5/input')
+    runs = RunCache('./day5/runs')  # a diagnostic run only depends on the system ID
 
     # part 1
     memory = initMemory.copy()
     inp=[1]
     expectedOutput=[]
-    endState = intcode(memory, inp, expectedOutput)
+    endState = intcode(memory, inp, expectedOutput, cache=runs)
     
     print("Part 1: Exxecution Result = {}\n".format(expectedOutput))
 
@@ -111,7 +113,7 @@ if __name__ == '__main__':
     memory = initMemory.copy()
     inp=[5]
     expectedOutput=[]
-    endState = intcode(memory, inp, expectedOutput)
+    endState = intcode(memory, inp, expectedOutput, cache=runs)
     
     print("Part 2: Exxecution Result = {}\n".format(expectedOutput))
 
@@ -1,12 +1,21 @@
-import queue
+import asyncio
 import sys, os, itertools
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from shared.intcode import intcode, Processor, Connector
+from shared.aio import AsyncProcessor, AsyncConnector
+from shared.network import RemoteProcessor, RingWire
+from shared.pool import ProcessorPool
+from shared.wire import Wire
+from shared.image import load_program
+from shared.specialize import specialize
+from shared.telemetry import Telemetry
 
 def run_amp(program, phase, input_signal=0, debug=False):
     output = []
-    intcode(program.copy(), input=[phase, input_signal], output=output, debug=debug)
+    # the phase setting is the same for many runs: start from after it
+    amp = specialize(program, [phase]).vm(input=[input_signal], output=output, debug=debug)
+    amp.run()
     return output.pop()
 
 def run_amp_chain(program, phase_seq, input_signal=0, debug=False):
@@ -17,22 +26,33 @@ def run_amp_chain(program, phase_seq, input_signal=0, debug=False):
         input_signal = output  # for next amp in chain
     return output
 
-def create_amp(id, code, phase, in_wire=None, out_wire=None, debug=False):
+def new_wire(name, telemetry=None, capacity=None):
+    if telemetry is None:
+        return Wire(capacity=capacity)
+    return telemetry.wire(name, capacity=capacity)
+
+def create_amp(id, code, phase, in_wire=None, out_wire=None, debug=False, telemetry=None, capacity=None):
     if not in_wire:
-        in_wire = queue.Queue()
+        in_wire = new_wire('-> {}'.format(id), telemetry, capacity)
     if not out_wire:
-        out_wire = queue.Queue()
+        out_wire = new_wire('{} ->'.format(id), telemetry, capacity)
     in_wire.put(phase)
-    p = Processor(id, code, in_wire, out_wire, debug=debug)
+    p = Processor(id, code, in_wire, out_wire, debug=debug, telemetry=telemetry)
     return (p, in_wire, out_wire)
 
-def create_circuit(code, phase_seq, debug=False):
+def create_circuit(code, phase_seq, debug=False, telemetry=None, capacity=None):
+    """
+    Five amps in a feedback loop. With a Telemetry, every amp and wire
+    reports into it, which shows which stage of the loop holds the others up.
+    With a capacity, an amp whose output wire is full waits for the next one.
+    """
     amps = {}
 
-    in_wire = queue.Queue()  # initial input
+    in_wire = new_wire('-> A', telemetry, capacity)  # initial input, then the feedback
     next_in_wire = in_wire
     for id, phase in zip('ABCDE', phase_seq):
-        amp, i, o = create_amp(id, code, phase, in_wire=next_in_wire, debug=debug)
+        amp, i, o = create_amp(id, code, phase,
+            in_wire=next_in_wire, debug=debug, telemetry=telemetry, capacity=capacity)
         next_in_wire = o
         amps[id] = amp
     
@@ -47,19 +67,28 @@ def create_circuit(code, phase_seq, debug=False):
     out_wire = amps['E'].out_wire
     return (amps, wires, in_wire, out_wire)
 
-def run_circuit(circuit, debug=False):
+def run_circuit(circuit, debug=False, pool=None):
+    """
+    Runs the circuit to completion and returns its output.
+    With a ProcessorPool, the amps and the feedback wire run on its threads
+    instead of starting threads of their own.
+    """
     (amps, wires, in_wire, out_wire) = circuit
     (feedback_wires, ) = wires
 
     # start all threads
-    for th in list(amps.values()) + list(wires):
-        th.start()
+    threads = list(amps.values()) + list(wires)
+    if pool is not None:
+        threads = [pool.start(th) for th in threads]
+    else:
+        for th in threads:
+            th.start()
 
     in_wire.put(0)  # first input
     amps['A'].add_listener( feedback_wires.disconnect )
 
-    # wait for all amps to halt
-    for th in amps.values():
+    # wait for all amps to halt, and the feedback wire to notice
+    for th in threads:
         if debug:
             print("WAITING ON: {}".format(th))
         th.join()
@@ -71,6 +100,89 @@ def run_circuit(circuit, debug=False):
 
     return out_wire.get()
 
+def create_async_circuit(code, phase_seq, debug=False):
+    """
+    Same circuit as create_circuit(), built from asyncio tasks and queues.
+    Must be called with an event loop running.
+    """
+    amps = {}
+
+    in_wire = asyncio.Queue()  # initial input
+    next_in_wire = in_wire
+    for id, phase in zip('ABCDE', phase_seq):
+        next_in_wire.put_nowait(phase)
+        out_wire = asyncio.Queue()
+        amps[id] = AsyncProcessor(id, code, next_in_wire, out_wire, debug=debug)
+        next_in_wire = out_wire
+
+    feedback_wire = AsyncConnector(
+        'E -> A',
+        in_wire=amps['E'].out_wire,
+        out_wire=amps['A'].in_wire,
+        debug=debug
+    )
+
+    wires = ( feedback_wire, )
+    out_wire = amps['E'].out_wire
+    return (amps, wires, in_wire, out_wire)
+
+async def run_async_circuit(circuit, debug=False):
+    (amps, wires, in_wire, out_wire) = circuit
+    (feedback_wires, ) = wires
+
+    for th in list(amps.values()) + list(wires):
+        th.start()
+
+    in_wire.put_nowait(0)  # first input
+    amps['A'].add_listener( feedback_wires.disconnect )
+
+    for th in list(amps.values()) + list(wires):
+        await th.join()
+
+    if out_wire.empty():
+        return None
+
+    return out_wire.get_nowait()
+
+async def run_async_circuits(code, phase_seqs, debug=False):
+    """
+    Evaluates one feedback circuit per phase sequence, all at once
+    in the current event loop. Returns { phase_seq: output }.
+    """
+    phase_seqs = list(phase_seqs)
+    outputs = await asyncio.gather(*(
+        run_async_circuit(create_async_circuit(code, phase_seq, debug=debug), debug=debug)
+        for phase_seq in phase_seqs
+    ))
+    return dict(zip(phase_seqs, outputs))
+
+def create_remote_circuit(code, phase_seq, debug=False):
+    """
+    Same circuit as create_circuit(), with every amp in a process of its own.
+    E writes straight into A's input wire, so no Connector is needed.
+    """
+    wires = [RingWire(values=[phase]) for phase in phase_seq]
+    wires[0].put(0)  # first input
+    amps = {}
+    for i, id in enumerate('ABCDE'):
+        amps[id] = RemoteProcessor(id, code,
+            in_wire=wires[i], out_wire=wires[(i + 1) % len(wires)], debug=debug)
+    return (amps, wires)
+
+def run_remote_circuit(circuit, debug=False):
+    (amps, wires) = circuit
+
+    for amp in amps.values():
+        amp.start()
+    for amp in amps.values():
+        amp.join()
+
+    # E's last output is left on A's input wire
+    output = wires[0].drain()
+    for wire in wires:
+        wire.unlink()
+    return output[-1] if output else None
+
 def input_generator(min=0, max=4, n=5):
     return itertools.permutations(range(min, max + 1), n)
 
@@ -136,13 +248,12 @@ if __name__ == '__main__':
             sys.exit(1)
 
 
-    with open('./day7/input') as input:
-        code = list(map(int, input.readline().split(',')))
+    code = load_program('./day7/input')
 
-        # part 1
-        task = lambda phase_seq: run_amp_chain(code, phase_seq)
-        run = find_best_score(task, input_generator(min=0, max=4), scoring_fn=IDENTITY)
-        print("Best run: {run}".format(**locals()))
+    # part 1
+    task = lambda phase_seq: run_amp_chain(code, phase_seq)
+    run = find_best_score(task, input_generator(min=0, max=4), scoring_fn=IDENTITY)
+    print("Best run: {run}".format(**locals()))
 
 
     # tests for part 2
@@ -159,12 +270,13 @@ if __name__ == '__main__':
             "ans-thrust": 18216,
         },
     ]
+    pool = ProcessorPool()
     for test_data in test_data_set:
         code = list(map(int, test_data["program"].split(',')))
 
-        def task(phase_seq):
+        def task(phase_seq, pool=None):
             circuit = create_circuit(code, phase_seq, debug=False)
-            output = run_circuit(circuit, debug=False)
+            output = run_circuit(circuit, debug=False, pool=pool)
             return output
 
         output = task(test_data["ans-phase"])
@@ -174,21 +286,45 @@ if __name__ == '__main__':
             ))
             sys.exit(1)
 
-        run = find_best_score(task, input_generator(min=5, max=9), scoring_fn=IDENTITY, debug=False)
+        # 120 circuits, on the same six threads
+        run = find_best_score(lambda phase_seq: task(phase_seq, pool=pool),
+            input_generator(min=5, max=9), scoring_fn=IDENTITY, debug=False)
         if run["inputs"] != test_data["ans-phase"] or run["result"] != test_data["ans-thrust"]:
             print("[B] Expected: Max output {} at phase {}\n Got: Max output {} at phase {}".format(
                 test_data["ans-thrust"], test_data["ans-phase"], run["result"], run["inputs"]
             ))
             sys.exit(1)
+
+        outputs = asyncio.run(run_async_circuits(code, input_generator(min=5, max=9)))
+        run = find_best_score(outputs.get, input_generator(min=5, max=9), scoring_fn=IDENTITY)
+        if run["inputs"] != test_data["ans-phase"] or run["result"] != test_data["ans-thrust"]:
+            print("[C] Expected: Max output {} at phase {}\n Got: Max output {} at phase {}".format(
+                test_data["ans-thrust"], test_data["ans-phase"], run["result"], run["inputs"]
+            ))
+            sys.exit(1)
+
+        output = run_remote_circuit(create_remote_circuit(code, test_data["ans-phase"]))
+        if output != test_data["ans-thrust"]:
+            print("[D] Expected: Output {} at phase {}\n Got: Output {}".format(
+                test_data["ans-thrust"], test_data["ans-phase"], output
+            ))
+            sys.exit(1)
+
+        telemetry = Telemetry()
+        output = run_circuit(create_circuit(code, test_data["ans-phase"], telemetry=telemetry))
+        transferred = telemetry.snapshot()["wires"]["A ->"]["transferred"]
+        if output != test_data["ans-thrust"] or transferred != telemetry.vms['B'].values_in:
+            print("[E] Expected: Output {} at phase {}\n Got: Output {}, {}".format(
+                test_data["ans-thrust"], test_data["ans-phase"], output, telemetry.json_line()
+            ))
+            sys.exit(1)
         
-    with open('./day7/input') as input:
-        code = list(map(int, input.readline().split(',')))
+    pool.close()
 
-        # part 2
-        def task(phase_seq):
-            circuit = create_circuit(code, phase_seq, debug=False)
-            output = run_circuit(circuit, debug=False)
-            return output
+    code = load_program('./day7/input')
 
-        run = find_best_score(task, input_generator(min=5, max=9), scoring_fn=IDENTITY)
-        print("Best run: {run}".format(**locals()))
+    # part 2
+    # all 120 circuits at once, in one event loop
+    outputs = asyncio.run(run_async_circuits(code, input_generator(min=5, max=9)))
+    run = find_best_score(outputs.get, input_generator(min=5, max=9), scoring_fn=IDENTITY)
+    print("Best run: {run}".format(**locals()))
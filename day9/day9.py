@@ -3,6 +3,8 @@ import sys, os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from shared.intcode import intcode
+from shared.image import load_program
+from shared.memo import RunCache
 
 
 if __name__ == '__main__':
@@ -45,14 +47,14 @@ if __name__ == '__main__':
                     print("Test Run of {} (input {}) = {}. Expected: {}".format(initMemory, inp, output, expectedOutput))
                     sys.exit(1)
 
-    with open('./day9/input') as input:
-        initMemory = [int(x) for x in input.readline().split(',')]
+    initMemory = load_program('./day9/input')
+    runs = RunCache('./day9/runs')  # BOOST only depends on its mode input
 
     # part 1
     memory = initMemory.copy()
     inp=[1]
     output=[]
-    endState = intcode(memory, inp, output, debug=False)
+    endState = intcode(memory, inp, output, debug=False, cache=runs)
     
     print("Part 1: Execution Result = {}\n".format(output))
 
@@ -60,6 +62,6 @@ if __name__ == '__main__':
     memory = initMemory.copy()
     inp=[2]
     output=[]
-    endState = intcode(memory, inp, output, debug=False)
+    endState = intcode(memory, inp, output, debug=False, cache=runs)
     
     print("Part 2: Execution Result = {}\n".format(output))
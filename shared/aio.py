@@ -0,0 +1,124 @@
+import asyncio
+
+from shared.intcode import IntcodeVM, NEEDS_INPUT, HALTED
+
+
+class AsyncProcessor(object):
+    """
+    asyncio counterpart of Processor: runs a VM as a task on the event loop
+    instead of in its own thread. Wires are asyncio.Queue's (anything with
+    awaitable get/put will do); the VM only gives up the loop while it
+    waits on its input wire or output wire.
+    """
+    def __init__(self, id, code,
+                 in_wire=None, out_wire=None, debug=False, engine=IntcodeVM):
+        self.id = id
+        self.in_wire = in_wire
+        self.out_wire = out_wire
+        self.debug = debug
+        self.listeners = []
+        self.task = None
+        self.vm = engine(code, id=str(self), debug=debug)
+
+        if self.debug:
+            print('{self}: Initialized'.format(**locals()))
+
+    def __str__(self):
+        return 'AsyncProc [{id}]'.format(id=self.id)
+
+    @property
+    def memory(self):
+        return self.vm.memory
+
+    def start(self):
+        """ Schedules the VM on the running event loop. """
+        self.task = asyncio.ensure_future(self.run())
+        return self.task
+
+    async def join(self):
+        await self.task
+
+    def abort(self):
+        print('{self}: ABORT'.format(**locals()))
+        self.vm.stop()
+        if self.task is not None:
+            self.task.cancel()
+
+    async def run(self):
+        if self.debug:
+            print('{self}: Started'.format(**locals()))
+
+        io = self.vm.execute()
+        event, value = next(io)
+        while event != HALTED:
+            if event == NEEDS_INPUT:
+                event, value = io.send(await self.in_wire.get())
+            else:
+                await self.out_wire.put(value)
+                event, value = next(io)
+
+        if self.debug:
+            print('{self}: Stopped'.format(**locals()))
+
+        for li in self.listeners:
+            li()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+
+class AsyncConnector(object):
+    """
+    asyncio counterpart of Connector. It sleeps on its input wire until a
+    value arrives, so there is no polling interval.
+    """
+    def __init__(self, id, in_wire=None, out_wire=None, debug=False):
+        self.id = id
+        self.in_wire = in_wire
+        self.out_wire = out_wire
+        self.stop = False
+        self.task = None
+        self.debug = debug
+
+        if self.debug:
+            print('{self}: Initialized'.format(**locals()))
+
+    def __str__(self):
+        return 'AsyncWire [{id}]'.format(id=self.id)
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+        return self.task
+
+    async def join(self):
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    def disconnect(self):
+        if self.debug:
+            print('{self}: Disconnecting'.format(**locals()))
+        self.stop = True
+        if self.task is not None:
+            self.task.cancel()
+
+    async def run(self):
+        if self.debug:
+            print('{self}: Started'.format(**locals()))
+        while not self.stop:
+            await self.process()
+
+        if self.debug:
+            print('{self}: Stopped'.format(**locals()))
+
+    async def process(self):
+        """
+        Base implementation is to simply transfer the data.
+        Override this for custom behavior.
+        """
+        if self.out_wire and self.in_wire:
+            i = await self.in_wire.get()
+            if self.debug:
+                print('{self}: ---[ {i} ]-->'.format(**locals()))
+            await self.out_wire.put(i)
@@ -0,0 +1,82 @@
+import multiprocessing
+
+from shared.intcode import IntcodeVM
+from shared.memory import PagedMemory
+
+# Program image of a pool worker; sent once per worker, not once per job.
+_base = None
+_engine = None
+_extract = None
+
+
+def _init_worker(program, engine, extract):
+    global _base, _engine, _extract
+    _base = PagedMemory(program)
+    _engine = engine
+    _extract = extract
+
+
+def _run_job(job):
+    patch, inputs = job
+    memory = _base.fork()
+    for address, value in (patch or {}).items():
+        memory[address] = value
+    output = []
+    vm = _engine(memory, input=list(inputs or []), output=output)
+    vm.run()
+    result = {
+        "memory": vm.memory,
+        "ip": vm.ip,
+        "output": output,
+    }
+    if _extract is not None:
+        return _extract(result)
+    # a plain list: pickling the PagedMemory would send its whole page table chain
+    result["memory"] = list(vm.memory)
+    return result
+
+
+def _pool(program, processes, engine, extract):
+    return multiprocessing.Pool(processes,
+        initializer=_init_worker, initargs=(list(program), engine, extract))
+
+
+def _chunksize(jobs, processes):
+    # a few chunks per worker keeps them busy without paying per-job IPC
+    return max(1, len(jobs) // ((processes or multiprocessing.cpu_count()) * 4))
+
+
+def run_batch(program, jobs, processes=None, chunksize=None, engine=IntcodeVM, extract=None):
+    """
+    Runs one program image many times across a process pool.
+
+    Each job is a (memory patch, input list) pair, where the patch is a
+    { address: value } dict applied on top of the image (either may be None).
+    Returns one { "memory", "ip", "output" } dict per job, in job order,
+    with the memory as a list. With `extract` (a picklable function, e.g. a
+    module-level one or a functools.partial of one), each result is
+    extract(result) instead, worked out in the worker, so only what the
+    caller needs comes back over the pipe.
+    """
+    jobs = list(jobs)
+    if chunksize is None:
+        chunksize = _chunksize(jobs, processes)
+    with _pool(program, processes, engine, extract) as pool:
+        return pool.map(_run_job, jobs, chunksize)
+
+
+def find_first(program, jobs, predicate, processes=None, chunksize=None, engine=IntcodeVM, extract=None):
+    """
+    Like run_batch(), but stops the pool at the first job (in job order)
+    whose result (after `extract`, if given) satisfies `predicate`.
+    Returns (job index, job, result), or None if nothing matched.
+    """
+    jobs = list(jobs)
+    if chunksize is None:
+        chunksize = _chunksize(jobs, processes)
+    with _pool(program, processes, engine, extract) as pool:
+        # leaving the with block terminates the workers still running
+        for index, result in enumerate(pool.imap(_run_job, jobs, chunksize)):
+            if predicate(result):
+                return index, jobs[index], result
+    return None
@@ -0,0 +1,116 @@
+import json
+import queue
+import struct
+import sys
+import zlib
+from array import array
+
+from shared.image import atomic_write
+from shared.intcode import IntcodeVM
+from shared.memory import PagedMemory, BIG
+from shared.ports import ListPort, AsciiPort, bind_output
+from shared.wire import Wire
+
+MAGIC = b'INTCKPT1'
+
+# magic, little-endian flag, halted flag, ip, relative base, number of words, length of the port section
+HEADER = struct.Struct('<8sBBqqQQ')
+
+
+def buffered(port):
+    """
+    The values waiting in `port` (unread input, or output nobody has taken
+    yet), or () for ports whose contents can't be seen without taking them.
+    """
+    if isinstance(port, Wire):
+        return list(port.buffer)
+    if isinstance(port, ListPort):
+        return list(port.values)
+    if isinstance(port, AsciiPort):
+        return list(port.pending)
+    if isinstance(port, queue.Queue):
+        with port.mutex:
+            return list(port.queue)
+    if isinstance(port, list):
+        return list(port)
+    return ()
+
+
+def dumps(vm):
+    """
+    Serializes `vm`: its memory, ip, relative base, halted flag, and the
+    values still waiting in its input and output ports.
+    """
+    big = {}
+    words = array('q')
+    for address, value in enumerate(vm.memory):
+        try:
+            if value == BIG:
+                raise OverflowError()
+            words.append(value)
+        except OverflowError:
+            words.append(BIG)
+            big[address] = value
+    ports = json.dumps({
+        "input": buffered(vm.input_port),
+        "output": buffered(vm.output),
+        "big": big,
+    }).encode()
+    header = HEADER.pack(MAGIC, sys.byteorder == 'little', vm.halted,
+        vm.ip, vm.relative_base, len(words), len(ports))
+    return header + ports + zlib.compress(words.tobytes())
+
+
+def loads(data, input=None, output=None, id='_', debug=False, engine=IntcodeVM, memory=PagedMemory):
+    """
+    Returns a VM that carries on from a checkpoint made by dumps().
+    The input the VM had not read yet comes first: ahead of `input` if it
+    is a list (or on its own if it is None), or put into `input` otherwise.
+    Output nobody had taken is written to `output` first, if one is given.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("Truncated checkpoint")
+    magic, little, halted, ip, relative_base, count, ports_size = HEADER.unpack_from(data)
+    if magic != MAGIC or little != (sys.byteorder == 'little'):
+        raise ValueError("Not a checkpoint for this machine")
+    ports = json.loads(data[HEADER.size:HEADER.size + ports_size].decode())
+    words = array('q')
+    words.frombytes(zlib.decompress(data[HEADER.size + ports_size:]))
+    if len(words) != count:
+        raise ValueError("Truncated checkpoint")
+
+    values = words.tolist()
+    for address, value in ports["big"].items():
+        values[int(address)] = value
+
+    if input is None or isinstance(input, list):
+        input = ports["input"] + (input or [])
+    else:
+        put = bind_output(input)
+        for value in ports["input"]:
+            put(value)
+    if output is not None:
+        write = bind_output(output)
+        for value in ports["output"]:
+            write(value)
+
+    vm = engine(memory(values), input=input, output=output, id=id, debug=debug)
+    vm.restore({
+        "memory": vm.memory,
+        "ip": ip,
+        "relative_base": relative_base,
+        "halted": bool(halted),
+    })
+    return vm
+
+
+def save_checkpoint(vm, path):
+    """ Writes dumps(vm) to `path`, replacing any older checkpoint there in one step. """
+    atomic_write(path, dumps(vm))
+
+
+def load_checkpoint(path, input=None, output=None, id='_', debug=False, engine=IntcodeVM, memory=PagedMemory):
+    """ Resumes the VM checkpointed at `path`; see loads(). """
+    with open(path, 'rb') as checkpoint:
+        return loads(checkpoint.read(),
+            input=input, output=output, id=id, debug=debug, engine=engine, memory=memory)
@@ -0,0 +1,252 @@
+from shared.intcode import IntcodeVM, decode
+
+# A block start must be reached this many times before it gets compiled;
+# colder code stays in the interpreter, where decoding is cheaper than codegen.
+COMPILE_THRESHOLD = 8
+
+# A block dropped this many times by writes into it (programs that keep
+# patching their own operands) is left to the interpreter for good.
+MAX_RECOMPILES = 2
+
+# Instruction lengths of the opcodes a block may contain.
+WIDTHS = {1: 4, 2: 4, 3: 2, 4: 2, 5: 3, 6: 3, 7: 4, 8: 4, 9: 2}
+
+# Compiled blocks, shared by every VM: (start, instruction words) -> function
+_block_cache = {}
+
+
+def operand(mode, word):
+    """ Source expression reading a parameter, with its mode folded in. """
+    if mode == 0:  # position mode
+        return 'm[{}]'.format(word)
+    if mode == 1:  # immediate mode
+        return '({})'.format(word)
+    if mode == 2:  # relative mode
+        return 'm[rb + ({})]'.format(word)
+    return None
+
+
+def target(mode, word):
+    """ Source expression of the address a parameter writes to. """
+    if mode == 0:  # position mode
+        return '{}'.format(word)
+    if mode == 2:  # relative mode
+        return 'rb + ({})'.format(word)
+    return None  # immediate (or unknown) mode cannot be written to
+
+
+def scan_block(memory, start):
+    """
+    Decodes the straight-line run of instructions starting at `start`.
+    The block ends after a jump, or before a halt or anything the
+    compiler cannot fold (the interpreter deals with those).
+    Returns ([(address, opcode, modes, parameter words)], end address).
+    """
+    instructions = []
+    ip = start
+    while True:
+        opcode, modes = decode(memory[ip])
+        if opcode not in WIDTHS:
+            break
+        width = WIDTHS[opcode]
+        words = tuple(memory[ip + i] for i in range(1, width))
+        if any(operand(modes[i], w) is None for i, w in enumerate(words)):
+            break
+        if opcode in (1, 2, 7, 8) and target(modes[2], words[2]) is None:
+            break
+        if opcode == 3 and target(modes[0], words[0]) is None:
+            break
+        instructions.append((ip, opcode, modes, words))
+        ip += width
+        if opcode in (5, 6):  # jumps end the block
+            break
+    return instructions, ip
+
+
+def generate(start, instructions, end):
+    """
+    Generates the Python source of one block.
+    The block function runs the instructions and returns the next ip.
+    """
+    lines = [
+        'def block_{}(vm):'.format(start),
+        '    m = vm.memory',
+        '    rb = vm.relative_base',
+        '    covered = vm.covered',
+        '    decoded = vm.decoded',
+    ]
+
+    def store(ip, next_ip, address, value):
+        # leave the block if the write lands on code we (or the interpreter) decoded
+        lines.extend([
+            '    a = {}'.format(address),
+            '    m[a] = {}'.format(value),
+            '    if a in covered or a in decoded:',
+            '        vm.relative_base = rb',
+            '        vm.invalidate(a)',
+            '        return {}'.format(next_ip),
+        ])
+
+    def sync(ip):
+        # I/O can fail (an empty or closed port): leave the VM resumable on this instruction
+        lines.extend([
+            '    vm.relative_base = rb',
+            '    vm.ip = {}'.format(ip),
+        ])
+
+    for ip, opcode, modes, words in instructions:
+        p = [operand(modes[i], w) for i, w in enumerate(words)]
+        if opcode == 1:  # add
+            store(ip, ip + 4, target(modes[2], words[2]), '{} + {}'.format(p[0], p[1]))
+        elif opcode == 2:  # mult
+            store(ip, ip + 4, target(modes[2], words[2]), '{} * {}'.format(p[0], p[1]))
+        elif opcode == 3:  # input
+            sync(ip)
+            store(ip, ip + 2, target(modes[0], words[0]), 'vm.read_input()')
+        elif opcode == 4:  # output
+            sync(ip)
+            lines.append('    vm.write_output({})'.format(p[0]))
+        elif opcode == 5:  # jump-if-true
+            lines.extend([
+                '    vm.relative_base = rb',
+                '    return {} if {} != 0 else {}'.format(p[1], p[0], ip + 3),
+            ])
+            return '\n'.join(lines)
+        elif opcode == 6:  # jump-if-false
+            lines.extend([
+                '    vm.relative_base = rb',
+                '    return {} if {} == 0 else {}'.format(p[1], p[0], ip + 3),
+            ])
+            return '\n'.join(lines)
+        elif opcode == 7:  # less-than
+            store(ip, ip + 4, target(modes[2], words[2]), '1 if {} < {} else 0'.format(p[0], p[1]))
+        elif opcode == 8:  # equals
+            store(ip, ip + 4, target(modes[2], words[2]), '1 if {} == {} else 0'.format(p[0], p[1]))
+        elif opcode == 9:  # adjust relative base
+            lines.append('    rb += {}'.format(p[0]))
+
+    lines.extend([
+        '    vm.relative_base = rb',
+        '    return {}'.format(end),
+    ])
+    return '\n'.join(lines)
+
+
+def compile_block(memory, start):
+    """
+    Returns (function, covered addresses) for the block at `start`,
+    or (None, None) when there is nothing there the compiler can fold.
+    """
+    instructions, end = scan_block(memory, start)
+    if not instructions:
+        return None, None
+
+    key = (start, tuple((memory[ip], words) for ip, _, _, words in instructions))
+    fn = _block_cache.get(key)
+    if fn is None:
+        source = generate(start, instructions, end)
+        namespace = {}
+        exec(compile(source, '<intcode block {}>'.format(start), 'exec'), namespace)
+        fn = _block_cache[key] = namespace['block_{}'.format(start)]
+    return fn, range(start, end)
+
+
+class CompiledVM(IntcodeVM):
+    """
+    IntcodeVM that compiles hot basic blocks into Python functions,
+    with parameter modes and immediates folded in as constants.
+
+    A write into a compiled block drops that block (it gets recompiled
+    from the new code once it is hot again, until it has been dropped
+    MAX_RECOMPILES times); everything else, including debug and profiled
+    runs, goes through the interpreter.
+
+    If a port raises inside a block, the VM is left on that input or output
+    instruction and run() can carry on from there once the port is ready.
+    Any other error inside a block leaves `ip` at the block's start, or at
+    the last input or output the block got through, with the block's
+    earlier writes done: such a crashed VM cannot be resumed.
+    """
+    def __init__(self, memory, input=None, output=None, id='_', debug=False, profile=False):
+        super(CompiledVM, self).__init__(memory,
+            input=input, output=output, id=id, debug=debug, profile=profile)
+        self.blocks = {}   # start address -> block function
+        self.spans = {}    # start address -> addresses covered by the block
+        self.covered = {}  # address -> start addresses of the blocks covering it
+        self.heat = {}     # address -> times reached by the interpreter
+        self.drops = {}    # start address -> times its block was invalidated
+
+    def invalidate(self, address):
+        super(CompiledVM, self).invalidate(address)
+        for start in self.covered.pop(address, ()):
+            self.blocks.pop(start, None)
+            drops = self.drops[start] = self.drops.get(start, 0) + 1
+            if drops >= MAX_RECOMPILES:
+                self.heat[start] = float('-inf')  # never hot again
+            for a in self.spans.pop(start, ()):
+                starts = self.covered.get(a)
+                if starts is not None:
+                    starts.discard(start)
+                    if not starts:
+                        del self.covered[a]
+
+    def restore(self, snapshot):
+        super(CompiledVM, self).restore(snapshot)
+        self.blocks.clear()
+        self.spans.clear()
+        self.covered.clear()
+
+    def compile(self, start):
+        fn, span = compile_block(self.memory, start)
+        if fn is not None:
+            self.blocks[start] = fn
+            self.spans[start] = span
+            for a in span:
+                self.covered.setdefault(a, set()).add(start)
+        return fn
+
+    def run(self):
+        if self.debug or self.profiler is not None or self.halted:
+            return super(CompiledVM, self).run()
+
+        blocks = self.blocks
+        heat = self.heat
+        decoded = self.decoded
+        ip = self.ip
+        try:
+            while not self.stopped:
+                block = blocks.get(ip)
+                if block is None:
+                    hits = heat[ip] = heat.get(ip, 0) + 1
+                    if hits >= COMPILE_THRESHOLD:
+                        block = self.compile(ip)
+                        if block is None:
+                            heat[ip] = float('-inf')  # nothing to compile here; stop trying
+                        else:
+                            del heat[ip]
+                if block is not None:
+                    self.ip = ip
+                    try:
+                        ip = block(self)
+                    except BaseException:
+                        ip = self.ip  # the I/O instruction that failed, if it got that far
+                        raise
+                    continue
+
+                # interpret a single instruction
+                try:
+                    opcode, modes, handler = decoded[ip]
+                except KeyError:
+                    opcode, modes, handler = self.predecode(ip)
+                if handler is None:  # halt
+                    ip += 1
+                    self.halted = True
+                    break
+                ip = handler(self, ip, modes)
+        except:
+            print("ERROR: Program crashed! {}".format(locals()))
+            raise
+        finally:
+            self.ip = ip
+        return self
+
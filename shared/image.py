@@ -0,0 +1,118 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from shared.memory import PagedMemory, BIG
+
+MAGIC = b'INTCODE1'
+
+# magic, sha1 of the program text, little-endian flag, number of words
+HEADER = struct.Struct('<8s20sBQ')
+
+
+def image_path(path):
+    """ The binary image lives next to the program text. """
+    return path + '.img'
+
+
+def parse(text):
+    return [int(x) for x in text.decode().splitlines()[0].split(',')]
+
+
+def atomic_write(path, data):
+    """
+    Writes the bytes `data` to `path` through a temporary file and an
+    os.replace(), so readers never see a half-written file.
+    """
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp, 'wb') as out:
+            out.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def image_digest(program):
+    """
+    sha1 of the program's values. For a PagedMemory the digest is kept on
+    the frozen page table its forks share, which is the same table every
+    time until the program is written to: asking again costs O(1), and the
+    digest goes away with the table.
+    """
+    if isinstance(program, PagedMemory):
+        table = program.fork().pages.base
+        digest = getattr(table, 'digest', None)
+        if digest is None:
+            digest = table.digest = image_digest(list(program))
+        return digest
+    return hashlib.sha1(','.join(map(str, program)).encode()).digest()
+
+
+def write_image(path, digest, values):
+    """
+    Writes `values` as native 64-bit words after a header.
+    Programs with values that do not fit are simply not cached.
+    """
+    try:
+        if BIG in values:
+            return False
+        words = array('q', values)
+    except OverflowError:
+        return False
+
+    header = HEADER.pack(MAGIC, digest, sys.byteorder == 'little', len(words))
+    try:
+        atomic_write(path, header + words.tobytes())
+    except OSError:
+        return False  # can't save one here: every load parses the text instead
+    return True
+
+
+def read_image(path, digest, memory=PagedMemory):
+    """
+    Memory-maps the image at `path` and builds memory straight from its words.
+    Raises ValueError if the image is not for this program text.
+    """
+    with open(path, 'rb') as image:
+        with mmap.mmap(image.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if len(mapped) < HEADER.size:
+                raise ValueError("Truncated image: {}".format(path))
+            magic, stored, little, count = HEADER.unpack_from(mapped)
+            if magic != MAGIC or stored != digest or little != (sys.byteorder == 'little'):
+                raise ValueError("Stale image: {}".format(path))
+            if len(mapped) != HEADER.size + count * 8:
+                raise ValueError("Truncated image: {}".format(path))
+
+            with memoryview(mapped) as view:
+                with view[HEADER.size:].cast('q') as words:
+                    return memory.from_words(words)
+
+
+def load_program(path, memory=PagedMemory):
+    """
+    Loads the comma-separated program at `path` as VM memory.
+
+    The first load parses the text and saves a binary image next to it,
+    keyed by a hash of the text; later loads map the image instead of
+    tokenizing the text again.
+    """
+    with open(path, 'rb') as input:
+        text = input.read()
+    digest = hashlib.sha1(text).digest()
+
+    try:
+        return read_image(image_path(path), digest, memory=memory)
+    except (OSError, ValueError):
+        pass
+
+    values = parse(text)
+    write_image(image_path(path), digest, values)
+    return memory(values)
@@ -1,207 +1,398 @@
-import queue
 import threading
+import time
+
+from shared.memory import PagedMemory
+from shared.ports import ListPort, bind_input, bind_output
+from shared.profiler import Profiler
+from shared.wire import WireClosed
+
+HALT = 99
+INPUT = 3
+OUTPUT = 4
+
+# Reasons execute() hands control back to its caller
+NEEDS_INPUT = 'input'
+HAS_OUTPUT = 'output'
+HALTED = 'halt'
 
-relative_base = 0
-stop = False
 
 def get_mode(modes, index):
     try:
-        return int(modes[-index])
+        return modes[index - 1]
     except:
         return 0  # default parameter mode
 
 
-def read(memory, parameter, mode):
-    try:
-        if mode == 0:  # position mode
-            return memory[parameter]
-        if mode == 1:  # immediate mode
-            return parameter
-        if mode == 2:  # relative mode
-            return memory[relative_base + parameter]
-    except:
-        print("ERROR Reading Memory: {}".format(locals()))
-        raise
-    raise Exception("Unknown parameter mode: " + mode)
-
-
-def read_param(memory, ip, index):
-    instruction = str(memory[ip])
-    pmodes = instruction[:-2]
-    param = memory[ip + index]
-    mode = get_mode(pmodes, index)
-    return read(memory, param, mode)
-
-
-def write_to_param(memory, ip, index, output):
-    instruction = str(memory[ip])
-    pmodes = instruction[:-2]
-    param = memory[ip + index]
-    mode = get_mode(pmodes, index)
-    if mode == 1:
-        raise Exception("PROGRAM ERROR: IMMEDIATE MODE NOT SUPPORTED FOR OUTPUT PARAMETER!")
-    if mode == 0:  # position mode
-        memory[param] = output
-        return
-    if mode == 2:  # relative mode
-        memory[relative_base + param] = output
-        return
-    raise Exception("Unknown parameter mode: {}".format(mode))
-
-
-def read_from_input(input):
-    if input is None:
-        raise Exception("Input not connected")
-    try:
-        # assume Queue w/ blocking get
-        return input.get()
-    except:
+def decode(instruction):
+    """
+    Splits an instruction into its opcode and its parameter modes.
+    """
+    opcode = instruction % 100
+    modes = (
+        instruction // 100 % 10,
+        instruction // 1000 % 10,
+        instruction // 10000 % 10,
+    )
+    return opcode, modes
+
+
+class IntcodeVM(object):
+    """
+    A single Intcode machine.
+    Owns its memory, instruction pointer, relative base and stop flag,
+    so any number of them can run side by side in one process.
+    """
+    def __init__(self, memory, input=None, output=None, id='_', debug=False, profile=False):
+        if isinstance(memory, PagedMemory):
+            self.memory = memory.fork()
+        else:
+            self.memory = PagedMemory(memory)
+        self.input = input
+        self.output = output
+        # what input is read from: a list is copied into a ListPort, so the caller's is never consumed
+        self.input_port = ListPort(input) if isinstance(input, list) else input
+        # bound once here, so I/O instructions don't need to work out what the ports are
+        self.read_input = bind_input(self.input_port)
+        self.write_output = bind_output(output)
+        self.id = id
+        self.debug = debug
+        self.ip = 0  # instruction pointer
+        self.relative_base = 0
+        self.stopped = False
+        self.halted = False
+        self.decoded = {}  # address -> (opcode, modes, handler)
+        # profile: True, or a Profiler to report into
+        self.profiler = Profiler() if profile is True else (profile or None)
+
+    def __str__(self):
+        return 'VM [{id}]'.format(id=self.id)
+
+    def stop(self):
+        """ Asks the run loop to stop before its next instruction. """
+        self.stopped = True
+
+    def fork(self, input=None, output=None, id=None):
+        """
+        Returns a new VM paused at the same point as this one.
+        Memory pages are shared with this VM until either one writes to them,
+        so a fork costs a page table copy plus the pages the child touches.
+        """
+        child = type(self)(self.memory,
+            input=input, output=output,
+            id=self.id if id is None else id, debug=self.debug,
+            profile=self.profiler is not None)
+        child.ip = self.ip
+        child.relative_base = self.relative_base
+        child.halted = self.halted
+        return child
+
+    def snapshot(self):
+        """
+        Captures the current state; hand it to restore() to rewind to it.
+        """
+        return {
+            "memory": self.memory.fork(),
+            "ip": self.ip,
+            "relative_base": self.relative_base,
+            "halted": self.halted,
+        }
+
+    def restore(self, snapshot):
+        watches = self.memory.watches()
+        self.memory = snapshot["memory"].fork()
+        for start, stop, callback in watches:
+            self.memory.watch(start, stop, callback)
+        self.ip = snapshot["ip"]
+        self.relative_base = snapshot["relative_base"]
+        self.halted = snapshot["halted"]
+        self.stopped = False
+        self.decoded.clear()
+
+    def watch(self, start, stop, callback):
+        """
+        Calls callback(address, old, new) whenever the program writes to
+        an address in range(start, stop). Survives restore().
+        """
+        self.memory.watch(start, stop, callback)
+
+    def unwatch(self, callback):
+        self.memory.unwatch(callback)
+
+    def read(self, parameter, mode):
         try:
-            # assume List
-            # I don't like this, need to re-design later.
-            input.reverse()
-            i = input.pop()
-            input.reverse()
-            return i
+            if mode == 0:  # position mode
+                return self.memory[parameter]
+            if mode == 1:  # immediate mode
+                return parameter
+            if mode == 2:  # relative mode
+                return self.memory[self.relative_base + parameter]
         except:
-            raise Exception("Cannot read from input")
+            print("ERROR Reading Memory: {}".format(locals()))
+            raise
+        raise Exception("Unknown parameter mode: {}".format(mode))
+
+    def read_param(self, ip, index, modes):
+        return self.read(self.memory[ip + index], get_mode(modes, index))
+
+    def write_to_param(self, ip, index, modes, output):
+        param = self.memory[ip + index]
+        mode = get_mode(modes, index)
+        if mode == 1:
+            raise Exception("PROGRAM ERROR: IMMEDIATE MODE NOT SUPPORTED FOR OUTPUT PARAMETER!")
+        if mode == 0:  # position mode
+            address = param
+        elif mode == 2:  # relative mode
+            address = self.relative_base + param
+        else:
+            raise Exception("Unknown parameter mode: {}".format(mode))
+        self.memory[address] = output
+        self.invalidate(address)
+
+    def invalidate(self, address):
+        """
+        Self-modifying code: forget the stale decoding of this address only.
+        """
+        self.decoded.pop(address, None)
 
+    def predecode(self, ip):
+        """
+        Decodes the instruction at `ip` into an (opcode, modes, handler) record,
+        and caches it by address until something writes to that address.
+        """
+        opcode, modes = decode(self.memory[ip])
+        if opcode == HALT:
+            handler = None
+        else:
+            try:
+                handler = getattr(type(self), OPCODES[opcode])
+            except KeyError:
+                raise Exception("Unknown opcode: {}".format(opcode))
+            if self.profiler is not None:
+                handler = self.profiler.wrap(opcode, handler)
+        record = self.decoded[ip] = (opcode, modes, handler)
+        return record
 
-def write_to_output(output, value):
-    if output is None:
-        raise Exception("Output not connected")
-    try:
-        # assume queue
-        output.put(value)
-    except:
+    def run(self):
+        if self.halted:  # past its HALT: nothing left to run
+            return self
+        decoded = self.decoded
+        ip = self.ip
         try:
-            # assume list
-            output.append(value)
+            while not self.stopped:
+                try:
+                    opcode, modes, handler = decoded[ip]
+                except KeyError:
+                    opcode, modes, handler = self.predecode(ip)
+                if handler is None:  # halt
+                    ip += 1
+                    self.halted = True
+                    break
+                ip = handler(self, ip, modes)
         except:
-            raise Exception("Cannot write to output")
-
-class SparseList(list):
-  def __setitem__(self, index, value):
-    missing = index - len(self) + 1
-    if missing > 0:
-      self.extend([0] * missing)
-    list.__setitem__(self, index, value)
-
-  def __getitem__(self, index):
-    try: return list.__getitem__(self, index)
-    except IndexError: return 0
-
-def intcode(memory, input=None, output=None, id='_', debug=False):
-    global relative_base
-    ip = 0  # instruction pointer
-    relative_base = 0  # reset relative base on start
-    memory = SparseList(memory)
-    try:
-        while not stop:
-            instruction = str(memory[ip])
-            opcode = int(instruction[-2:])
-            if opcode == 1:  # add
-                p1 = read_param(memory, ip, 1)
-                p2 = read_param(memory, ip, 2)
-                sum = p1 + p2
-                if debug:
-                    print("{id}:#{ip} ADD   {p1} + {p2} = {sum}".format(**locals()))
-                write_to_param(memory, ip, 3, sum)
-                ip += 4
-                
-            elif opcode == 2:  # mult
-                p1 = read_param(memory, ip, 1)
-                p2 = read_param(memory, ip, 2)
-                prod = p1 * p2
-                if debug:
-                    print("{id}:#{ip} MULT  {p1} x {p2} = {prod}".format(**locals()))
-                write_to_param(memory, ip, 3, prod)
-                ip += 4
-
-            elif opcode == 3:  # input
-                inp = read_from_input(input)  # saving input
-                if debug:
-                    print("{id}:#{ip} INPUT {inp}".format(**locals()))
-                write_to_param(memory, ip, 1, inp)
-                ip += 2
-
-            elif opcode == 4:  # output
-                p1 = read_param(memory, ip, 1)
-                if debug:
-                    print("{id}:#{ip} OUTPT {p1}".format(**locals()))
-                write_to_output(output, p1)
-                ip += 2
-
-            elif opcode == 5:  # jump-if-true
-                p1 = read_param(memory, ip, 1)
-                p2 = read_param(memory, ip, 2)
-                if debug:
-                    print("{id}:#{ip} JMP IF TRUE {p1} ==> &{p2}".format(**locals()))
-                if p1 != 0:
-                    ip = p2
-                else:
-                    ip += 3
-            
-            elif opcode == 6:  # jump-if-false
-                p1 = read_param(memory, ip, 1)
-                p2 = read_param(memory, ip, 2)
-                if debug:
-                    print("{id}:#{ip} JMP IF FALSE {p1} ==> &{p2}".format(**locals()))
-                if p1 == 0:
-                    ip = p2
+            print("ERROR: Program crashed! {}".format(locals()))
+            if self.profiler is not None:
+                self.profiler.dump_trace()
+            raise
+        finally:
+            self.ip = ip
+        return self
+
+    def execute(self):
+        """
+        Runs the program as a generator that gives control back on every I/O:
+            (NEEDS_INPUT, None)  - send() the input value to resume
+            (HAS_OUTPUT, value)  - next() to resume
+            (HALTED, None)       - the program is done
+        The VM's own input/output ports are not used.
+        A VM that has already halted only gives (HALTED, None).
+        """
+        if self.halted:
+            yield (HALTED, None)
+            return
+        decoded = self.decoded
+        profiler = self.profiler
+        ip = self.ip
+        try:
+            while not self.stopped:
+                try:
+                    opcode, modes, handler = decoded[ip]
+                except KeyError:
+                    opcode, modes, handler = self.predecode(ip)
+                if handler is None:  # halt
+                    ip += 1
+                    self.halted = True
+                    break
+                if opcode == INPUT:
+                    self.ip = ip
+                    if profiler is not None:
+                        profiler.record(self.memory, ip, opcode, modes)
+                        start = time.perf_counter()
+                    inp = yield (NEEDS_INPUT, None)
+                    if profiler is not None:
+                        profiler.io_wait += time.perf_counter() - start
+                    if self.debug:
+                        print("{id}:#{ip} INPUT {inp}".format(id=self.id, **locals()))
+                    self.write_to_param(ip, 1, modes, inp)
+                    ip += 2
+                elif opcode == OUTPUT:
+                    p1 = self.read_param(ip, 1, modes)
+                    if self.debug:
+                        print("{id}:#{ip} OUTPT {p1}".format(id=self.id, **locals()))
+                    ip = self.ip = ip + 2
+                    if profiler is not None:
+                        profiler.record(self.memory, ip - 2, opcode, modes)
+                        start = time.perf_counter()
+                    yield (HAS_OUTPUT, p1)
+                    if profiler is not None:
+                        profiler.io_wait += time.perf_counter() - start
                 else:
-                    ip += 3
-
-            elif opcode == 7:  # less-than
-                p1 = read_param(memory, ip, 1)
-                p2 = read_param(memory, ip, 2)
-                if debug:
-                    print("{id}:#{ip} LESS THAN {p1} < {p2}".format(**locals()))
-                result = 1 if p1 < p2 else 0
-                write_to_param(memory, ip, 3, result)
-                ip += 4
-
-            elif opcode == 8:  # equals
-                p1 = read_param(memory, ip, 1)
-                p2 = read_param(memory, ip, 2)
-                if debug:
-                    print("{id}:#{ip} EQUALS {p1} == {p2}".format(**locals()))
-                result = 1 if p1 == p2 else 0
-                write_to_param(memory, ip, 3, result)
-                ip += 4
-
-            elif opcode == 9:  # adjust relative base
-                p1 = read_param(memory, ip, 1)
-                relative_base += p1
-                if debug:
-                    print("{id}:#{ip} ADJ REL_BASE -> {relative_base}".format(relative_base=relative_base, **locals()))
-                ip += 2
-
-            elif opcode == 99:
-                ip += 1
-                break
-            else:
-                raise Exception("Unknown opcode: " + opcode)
+                    ip = handler(self, ip, modes)
+        except GeneratorExit:
+            # abandoned while suspended; self.ip already points at the I/O
+            raise
+        except:
+            self.ip = ip
+            print("ERROR: Program crashed! {}".format(locals()))
+            if profiler is not None:
+                profiler.dump_trace()
+            raise
+        self.ip = ip
+        if self.halted:  # a stopped VM just ends the generator
+            yield (HALTED, None)
+
+    # Opcode handlers.
+    # Each one executes the instruction at `ip` and returns the next `ip`.
+
+    def op_add(self, ip, modes):
+        p1 = self.read_param(ip, 1, modes)
+        p2 = self.read_param(ip, 2, modes)
+        sum = p1 + p2
+        if self.debug:
+            print("{id}:#{ip} ADD   {p1} + {p2} = {sum}".format(id=self.id, **locals()))
+        self.write_to_param(ip, 3, modes, sum)
+        return ip + 4
+
+    def op_mult(self, ip, modes):
+        p1 = self.read_param(ip, 1, modes)
+        p2 = self.read_param(ip, 2, modes)
+        prod = p1 * p2
+        if self.debug:
+            print("{id}:#{ip} MULT  {p1} x {p2} = {prod}".format(id=self.id, **locals()))
+        self.write_to_param(ip, 3, modes, prod)
+        return ip + 4
+
+    def op_input(self, ip, modes):
+        inp = self.read_input()  # saving input
+        if self.debug:
+            print("{id}:#{ip} INPUT {inp}".format(id=self.id, **locals()))
+        self.write_to_param(ip, 1, modes, inp)
+        return ip + 2
+
+    def op_output(self, ip, modes):
+        p1 = self.read_param(ip, 1, modes)
+        if self.debug:
+            print("{id}:#{ip} OUTPT {p1}".format(id=self.id, **locals()))
+        self.write_output(p1)
+        return ip + 2
+
+    def op_jump_if_true(self, ip, modes):
+        p1 = self.read_param(ip, 1, modes)
+        p2 = self.read_param(ip, 2, modes)
+        if self.debug:
+            print("{id}:#{ip} JMP IF TRUE {p1} ==> &{p2}".format(id=self.id, **locals()))
+        if p1 != 0:
+            return p2
+        return ip + 3
+
+    def op_jump_if_false(self, ip, modes):
+        p1 = self.read_param(ip, 1, modes)
+        p2 = self.read_param(ip, 2, modes)
+        if self.debug:
+            print("{id}:#{ip} JMP IF FALSE {p1} ==> &{p2}".format(id=self.id, **locals()))
+        if p1 == 0:
+            return p2
+        return ip + 3
+
+    def op_less_than(self, ip, modes):
+        p1 = self.read_param(ip, 1, modes)
+        p2 = self.read_param(ip, 2, modes)
+        if self.debug:
+            print("{id}:#{ip} LESS THAN {p1} < {p2}".format(id=self.id, **locals()))
+        result = 1 if p1 < p2 else 0
+        self.write_to_param(ip, 3, modes, result)
+        return ip + 4
+
+    def op_equals(self, ip, modes):
+        p1 = self.read_param(ip, 1, modes)
+        p2 = self.read_param(ip, 2, modes)
+        if self.debug:
+            print("{id}:#{ip} EQUALS {p1} == {p2}".format(id=self.id, **locals()))
+        result = 1 if p1 == p2 else 0
+        self.write_to_param(ip, 3, modes, result)
+        return ip + 4
+
+    def op_adjust_relative_base(self, ip, modes):
+        p1 = self.read_param(ip, 1, modes)
+        self.relative_base += p1
+        if self.debug:
+            print("{id}:#{ip} ADJ REL_BASE -> {relative_base}".format(
+                id=self.id, relative_base=self.relative_base, **locals()))
+        return ip + 2
+
+
+# opcode -> handler method; looked up on the VM's class, so subclasses can override them
+OPCODES = {
+    1: 'op_add',
+    2: 'op_mult',
+    3: 'op_input',
+    4: 'op_output',
+    5: 'op_jump_if_true',
+    6: 'op_jump_if_false',
+    7: 'op_less_than',
+    8: 'op_equals',
+    9: 'op_adjust_relative_base',
+}
+
+
+def intcode(memory, input=None, output=None, id='_', debug=False, engine=IntcodeVM, profile=False, cache=None):
+    """
+    Runs a program to completion. With a `cache` (a shared.memo.RunCache),
+    a run with a list of inputs may be answered from the cache instead.
+    """
+    if cache is not None and not debug and not profile and (input is None or isinstance(input, list)):
+        endState = cache.run(memory, input=input, output=output, engine=engine)
         return {
-            "memory": memory,
-            "ip": ip,
+            "memory": endState["memory"],
+            "ip": endState["ip"],
         }
-    except:
-        print("ERROR: Program crashed! {}".format(locals()))
-        raise
+    vm = engine(memory, input=input, output=output, id=id, debug=debug, profile=profile)
+    vm.run()
+    endState = {
+        "memory": vm.memory,
+        "ip": vm.ip,
+    }
+    if vm.profiler is not None:
+        endState["profile"] = vm.profiler.report()
+    return endState
 
 
 class Processor(threading.Thread):
     def __init__(self, id, code,
-                 in_wire=None, out_wire=None, debug=False):
+                 in_wire=None, out_wire=None, debug=False, engine=IntcodeVM, profile=False,
+                 telemetry=None):
         super(Processor, self).__init__(name='Proc <{id}>'.format(**locals()))
 
         self.id = id
-        self.memory = code.copy()
         self.in_wire = in_wire
         self.out_wire = out_wire
         self.debug = debug
         self.listeners = []
+        self.error = None  # what the VM crashed with, if it did
+        self.vm = engine(code,
+            input=in_wire, output=out_wire,
+            id=str(self), debug=debug, profile=profile)
+        # telemetry: a Telemetry to report this VM's I/O and run time into
+        self.stats = None if telemetry is None else telemetry.vm(id, self.vm)
         
         if self.debug:
             print('{self}: Initialized'.format(**locals()))
@@ -209,22 +400,41 @@ class Processor(threading.Thread):
     def __str__(self):
         return 'Proc [{id}]'.format(id=self.id)
 
-    @staticmethod
-    def abort():
-        print('Intcode: ABORT'.format(**locals()))
+    @property
+    def memory(self):
+        return self.vm.memory
+
+    @property
+    def profile(self):
+        """ The VM's profiler report, if it was created with profile=True. """
+        if self.vm.profiler is None:
+            return None
+        return self.vm.profiler.report()
 
-        global stop
-        stop = True
+    def abort(self):
+        """ Stops this processor's VM; other processors keep running. """
+        print('{self}: ABORT'.format(**locals()))
+        self.vm.stop()
 
     def run(self):
         if self.debug:
             print('{self}: Started'.format(**locals()))
-        intcode(self.memory,
-            input=self.in_wire, output=self.out_wire,
-            id=str(self), debug=self.debug)
-        if self.debug:
-            print('{self}: Stopped'.format(**locals()))
-            
+        if self.stats is not None:
+            self.stats.start()
+        try:
+            self.vm.run()
+        except BaseException as e:
+            self.error = e
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.stop()
+            if self.debug:
+                print('{self}: Stopped'.format(**locals()))
+            # halted or crashed: nothing more will come (an abort() leaves the wire open)
+            if not self.vm.stopped and hasattr(self.out_wire, 'close'):
+                self.out_wire.close()  # wakes whoever reads it
+
         for li in self.listeners:
             li()
     
@@ -252,19 +462,41 @@ class Connector(threading.Thread):
         if self.debug:
             print('{self}: Disconnecting'.format(**locals()))
         self.stop = True
+        if hasattr(self.in_wire, 'wake'):
+            self.in_wire.wake()
+
+    def wait(self):
+        """
+        Blocks until there is input to process.
+        Returns False once the in-wire is closed and drained.
+        """
+        if hasattr(self.in_wire, 'wait'):  # a Wire (or anything like one)
+            while not self.in_wire.wait():
+                if self.stop or self.in_wire.closed:
+                    return not self.in_wire.closed
+            return True
+        # plain queue: poll it
+        if self.in_wire.empty():
+            with self.in_wire.not_empty:
+                self.in_wire.not_empty.wait(timeout=0.2)
+        return True
 
     def run(self):
         if self.debug:
             print('{self}: Started'.format(**locals()))
         while not self.stop:
-            if self.in_wire.empty():
-                with self.in_wire.not_empty:
-                    self.in_wire.not_empty.wait(timeout=0.2)
+            if not self.wait():
+                # our producer is done, so are we
+                if hasattr(self.out_wire, 'close'):
+                    self.out_wire.close()
+                break
             if self.stop:
                 break
 
             try:
                 self.process()
+            except WireClosed:
+                break
             except BaseException as e:
                 print("EXCEPTION: {}".format(e))
                 raise
@@ -278,6 +510,12 @@ class Connector(threading.Thread):
         Override this for custom behavior.
         """
         if self.out_wire and self.in_wire:
+            if hasattr(self.in_wire, 'drain') and hasattr(self.out_wire, 'put_many'):
+                values = self.in_wire.drain()
+                if self.debug:
+                    print('{self}: ---{values}-->'.format(**locals()))
+                self.out_wire.put_many(values)
+                return
             i = self.in_wire.get()
             if self.debug:
                 print('{self}: ---[ {i} ]-->'.format(**locals()))
@@ -0,0 +1,224 @@
+from collections import deque
+
+import numpy as np
+
+from shared.intcode import IntcodeVM, HALT, decode
+from shared.memory import PagedMemory
+
+# Smaller groups are cheaper to run one VM at a time than one NumPy call per instruction.
+MIN_GROUP = 16
+
+# The memory array of a whole batch grows up to this size; rows addressing
+# past the widest it can be made carry on in a scalar VM instead.
+MAX_BYTES = 1 << 26
+
+# |operands| below these bounds cannot overflow int64 when added / multiplied
+ADD_BOUND = 1 << 62
+MULT_BOUND = 1 << 31
+
+WIDTHS = {1: 4, 2: 4, 3: 2, 4: 2, 5: 3, 6: 3, 7: 4, 8: 4, 9: 2}
+
+
+class Diverged(Exception):
+    """ Raised before an instruction has any effect, when the rows of a group disagree. """
+    def __init__(self, keys):
+        self.keys = keys
+
+
+class Lockstep(object):
+    """
+    Runs many instances of one program as the rows of a 2-D int64 array,
+    executing each instruction for every row of a group with one NumPy
+    operation. A group shares its ip and relative base; rows whose
+    instruction, jump or relative base disagree are split into new groups,
+    and groups smaller than MIN_GROUP - or rows that would overflow int64 or
+    touch memory past what MAX_BYTES allows for the batch - carry on in a
+    scalar VM.
+    """
+    def __init__(self, program, jobs, engine=IntcodeVM):
+        program = list(program)
+        jobs = list(jobs)
+        size = max([len(program)] + [address + 1 for patch, _ in jobs for address in (patch or {})])
+
+        self.engine = engine
+        self.memory = np.zeros((len(jobs), size), dtype=np.int64)
+        self.memory[:, :len(program)] = program
+        for row, (patch, _) in enumerate(jobs):
+            for address, value in (patch or {}).items():
+                self.memory[row, address] = value
+        self.lengths = np.full(len(jobs), size, dtype=np.int64)  # as len() of a PagedMemory
+        self.inputs = [deque(inputs or []) for _, inputs in jobs]
+        self.outputs = [[] for _ in jobs]
+        self.results = [None] * len(jobs)
+        self.groups = []
+
+    def run(self):
+        """ Returns one { "memory", "ip", "output" } dict per job, in job order. """
+        self.push(np.arange(len(self.results)), 0, 0)
+        while self.groups:
+            self.run_group(*self.groups.pop())
+        return self.results
+
+    def push(self, rows, ip, rb):
+        if len(rows) >= MIN_GROUP:
+            self.groups.append((rows, ip, rb))
+        else:
+            for row in rows.tolist():
+                self.run_scalar(row, ip, rb)
+
+    def split(self, rows, keys, ip, rb, step):
+        """ Pushes one group per distinct key; step(key) gives its (ip, rb). """
+        for key in np.unique(keys).tolist():
+            self.push(rows[keys == key], *step(key))
+
+    def drop(self, rows, ok, ip, rb):
+        """ Hands the rows where `ok` is False to the scalar VM. """
+        for row in rows[~ok].tolist():
+            self.run_scalar(row, ip, rb)
+        self.push(rows[ok], ip, rb)
+
+    def grow(self, size):
+        """
+        Widens every row to at least `size` words, unless that would take the
+        array past MAX_BYTES; returns whether it did. Reads past a row's length are 0.
+        """
+        rows, width = self.memory.shape
+        if size <= width:
+            return True
+        limit = MAX_BYTES // (self.memory.itemsize * rows)
+        if size > limit:
+            return False
+        size = min(max(size, 2 * width), limit)
+        self.memory = np.pad(self.memory, ((0, 0), (0, size - width)))
+        return True
+
+    def row_memory(self, row):
+        return PagedMemory(self.memory[row, :self.lengths[row]].tolist())
+
+    def run_scalar(self, row, ip, rb):
+        vm = self.engine(self.row_memory(row),
+            input=list(self.inputs[row]), output=self.outputs[row])
+        vm.ip = ip
+        vm.relative_base = rb
+        vm.run()
+        self.finish(row, vm.memory, vm.ip)
+
+    def finish(self, row, memory, ip):
+        self.results[row] = {
+            "memory": memory,
+            "ip": ip,
+            "output": self.outputs[row],
+        }
+
+    def run_group(self, rows, ip, rb):
+        try:
+            while True:
+                if ip < 0 or not self.grow(ip + 4):
+                    raise Diverged(None)
+                memory = self.memory
+                words = memory[rows, ip]
+                if (words != words[0]).any():
+                    self.split(rows, words, ip, rb, lambda word: (ip, rb))
+                    return
+                opcode, modes = decode(int(words[0]))
+                if opcode == HALT:
+                    for row in rows.tolist():
+                        self.finish(row, self.row_memory(row), ip + 1)
+                    return
+                if opcode not in WIDTHS:
+                    raise Diverged(None)  # let the scalar VM report it
+                params = memory[rows, ip + 1:ip + WIDTHS[opcode]]
+
+                def address(index):
+                    mode = modes[index]
+                    if mode == 1:
+                        raise Diverged(None)
+                    address = params[:, index] + (rb if mode == 2 else 0)
+                    ok = address >= 0
+                    if not ok.all():
+                        raise Diverged(ok)
+                    if not self.grow(int(address.max()) + 1):
+                        # only the rows reaching past what the batch can afford leave
+                        raise Diverged(address < self.memory.shape[1])
+                    return address
+
+                def value(index):
+                    if modes[index] == 1:
+                        return params[:, index]
+                    return self.memory[rows, address(index)]
+
+                def store(target, values):
+                    self.memory[rows, target] = values
+                    self.lengths[rows] = np.maximum(self.lengths[rows], target + 1)
+
+                def write(index, values):
+                    store(address(index), values)
+
+                if opcode in (1, 2):  # add, mult
+                    p1, p2 = value(0), value(1)
+                    bound = ADD_BOUND if opcode == 1 else MULT_BOUND
+                    ok = (np.abs(p1) < bound) & (np.abs(p2) < bound)
+                    if not ok.all():
+                        raise Diverged(ok)
+                    write(2, p1 + p2 if opcode == 1 else p1 * p2)
+                    ip += 4
+                elif opcode == 3:  # input
+                    ok = np.array([len(self.inputs[row]) > 0 for row in rows.tolist()])
+                    if not ok.all():
+                        raise Diverged(ok)
+                    target = address(0)  # may diverge: take no input before it can't
+                    store(target, [self.inputs[row].popleft() for row in rows.tolist()])
+                    ip += 2
+                elif opcode == 4:  # output
+                    for row, p1 in zip(rows.tolist(), value(0).tolist()):
+                        self.outputs[row].append(p1)
+                    ip += 2
+                elif opcode in (5, 6):  # jump if true, jump if false
+                    p1, p2 = value(0), value(1)
+                    taken = (p1 != 0) if opcode == 5 else (p1 == 0)
+                    next_ip = np.where(taken, p2, ip + 3)
+                    if (next_ip != next_ip[0]).any():
+                        self.split(rows, next_ip, ip, rb, lambda target: (target, rb))
+                        return
+                    ip = int(next_ip[0])
+                elif opcode in (7, 8):  # less than, equals
+                    p1, p2 = value(0), value(1)
+                    result = (p1 < p2) if opcode == 7 else (p1 == p2)
+                    write(2, result)
+                    ip += 4
+                else:  # adjust relative base
+                    p1 = value(0)
+                    if (p1 != p1[0]).any():
+                        self.split(rows, p1, ip, rb, lambda delta: (ip + 2, rb + delta))
+                        return
+                    rb += int(p1[0])
+                    ip += 2
+        except Diverged as e:
+            if e.keys is None:
+                e.keys = np.zeros(len(rows), dtype=bool)
+            self.drop(rows, e.keys, ip, rb)
+
+
+def run_lockstep(program, jobs, engine=IntcodeVM):
+    """
+    Runs one program image once per job, in lockstep: see Lockstep.
+
+    Jobs and results are the same as for run_batch(): each job is a
+    (memory patch, input list) pair and each result a
+    { "memory", "ip", "output" } dict, in job order.
+    Needs numpy; for a handful of jobs plain VMs are just as fast.
+    """
+    return Lockstep(program, jobs, engine=engine).run()
+
+
+if __name__ == '__main__':
+    import sys
+
+    # an input stored past what the batch can afford: every row drops to a
+    # scalar VM, which must still find its input there
+    program = [109, MAX_BYTES // 8, 203, 0, 204, 0, 99]
+    jobs = [(None, [i]) for i in range(20)]
+    outputs = [result["output"] for result in run_lockstep(program, jobs)]
+    if outputs != [[i] for i in range(20)]:
+        print("Lockstep run of {} = {}. Expected: {}".format(program, outputs, [[i] for i in range(20)]))
+        sys.exit(1)
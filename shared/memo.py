@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from shared.image import atomic_write, image_digest
+from shared.intcode import IntcodeVM
+from shared.memory import PagedMemory
+from shared.ports import bind_output
+
+
+class RunCache(object):
+    """
+    Opt-in cache of whole program runs, for runs that are a pure function
+    of (program, inputs). A hit skips execution: the outputs are written to
+    the output port in their original order and the final memory and ip
+    are returned as if the program had just run.
+
+    Results are kept in an in-memory LRU of `maxsize` runs and, if `path`
+    is given, in one JSON file per run under that directory, evicting the
+    least recently used files once they add up to more than `max_bytes`.
+    """
+    def __init__(self, path=None, maxsize=128, max_bytes=64 << 20):
+        self.path = path
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.runs = OrderedDict()  # key -> { "memory", "ip", "output" }
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def key(self, program, inputs):
+        inputs = ','.join(map(str, inputs)).encode()
+        return hashlib.sha1(image_digest(program) + b'|' + inputs).hexdigest()
+
+    def run(self, program, input=None, output=None, engine=IntcodeVM):
+        """
+        Runs `program` on the `input` list (or None) like intcode(), unless
+        the same run is cached. Returns { "memory", "ip", "output" }.
+        """
+        inputs = list(input or [])
+        key = self.key(program, inputs)
+        result = self.lookup(key)
+        if result is None:
+            self.misses += 1
+            outputs = []
+            vm = engine(program, input=list(inputs), output=outputs)
+            vm.run()
+            result = {
+                "memory": vm.memory,
+                "ip": vm.ip,
+                "output": outputs,
+            }
+            self.store(key, result)
+        else:
+            self.hits += 1
+
+        if output is not None:
+            write = bind_output(output)
+            for value in result["output"]:
+                write(value)
+        return {
+            "memory": result["memory"].fork(),
+            "ip": result["ip"],
+            "output": list(result["output"]),
+        }
+
+    def lookup(self, key):
+        result = self.runs.get(key)
+        if result is not None:
+            self.runs.move_to_end(key)
+            return result
+        if self.path is None:
+            return None
+        file = self.file(key)
+        try:
+            with open(file) as input:
+                saved = json.load(input)
+            os.utime(file)  # recently used
+        except (OSError, ValueError):
+            return None
+        result = {
+            "memory": PagedMemory(saved["memory"]),
+            "ip": saved["ip"],
+            "output": saved["output"],
+        }
+        self.remember(key, result)
+        return result
+
+    def store(self, key, result):
+        self.remember(key, result)
+        if self.path is None:
+            return
+        data = json.dumps({
+            "memory": list(result["memory"]),
+            "ip": result["ip"],
+            "output": result["output"],
+        }).encode()
+        try:
+            atomic_write(self.file(key), data)
+        except OSError:
+            return  # not on disk, so the run only lasts as long as this process remembers it
+        self.evict()
+
+    def remember(self, key, result):
+        self.runs[key] = result
+        self.runs.move_to_end(key)
+        while len(self.runs) > self.maxsize:
+            self.runs.popitem(last=False)
+
+    def file(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def evict(self):
+        """ Removes the least recently used files until the directory fits in max_bytes. """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        while total > self.max_bytes and entries:
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,352 @@
+from array import array
+
+PAGE_BITS = 8
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+# Stands in for every page that has never been written to.
+ZERO_PAGE = (0,) * PAGE_SIZE
+
+
+def bad_address(index):
+    """ The error for an address that is not a non-negative int. """
+    if isinstance(index, slice):
+        return TypeError("Memory cannot be sliced; use list(memory)[...]")
+    if isinstance(index, int):
+        return IndexError("Negative memory address: {}".format(index))
+    return TypeError("Memory addresses are ints, not {!r}".format(index))
+
+
+class PageTable(dict):
+    """
+    Page number -> page.
+    A fork's table starts out empty on top of the table it was forked from,
+    which nobody writes to any more; pages missing here are looked up there
+    on first use, and the reference is kept.
+    """
+    def __init__(self, pages=(), base=None, zero=ZERO_PAGE):
+        super(PageTable, self).__init__(pages)
+        self.base = base
+        self.zero = zero  # what a never-written page reads as
+        self.depth = 0 if base is None else base.depth + 1
+
+    def __missing__(self, n):
+        if n < 0:
+            # never stored, so negative addresses always end up here
+            raise IndexError("Negative memory address")
+        page = self[n] = self.zero if self.base is None else self.base[n]
+        return page
+
+    def copy(self):
+        return PageTable(self, base=self.base, zero=self.zero)
+
+    def flatten(self):
+        """ The same mapping as a table with no base. """
+        if self.base is None:
+            return PageTable(self, zero=self.zero)
+        pages = self.base.flatten()
+        pages.update(self)
+        return pages
+
+
+class PagedMemory(object):
+    """
+    Intcode memory split into fixed-size pages.
+
+    A page is only allocated when something is written to it; reads of
+    untouched addresses come from the shared ZERO_PAGE. Pages can also be
+    shared between forks: fork() freezes the page table and gives both sides
+    an empty table on top of it, so it costs O(1) whatever the size of the
+    image. Each side then copies a page the first time it writes to it, and
+    a run only pays for the pages it actually uses.
+    """
+    ZERO = ZERO_PAGE
+
+    # Forks of forks make chains of tables; past this many, fork() flattens them.
+    MAX_DEPTH = 32
+
+    # page number -> ((start, stop, callback), ...) for the watches on it
+    watched = {}
+    # pages of ours that hold watched addresses: kept out of `owned`, so
+    # writes to them go through write_watched(), but never copied again
+    owned_watched = frozenset()
+
+    def __init__(self, values=()):
+        values = list(values)
+        self.length = len(values)
+        self.pages = PageTable(zero=self.ZERO)  # page number -> list of PAGE_SIZE values
+        for start in range(0, len(values), PAGE_SIZE):
+            page = values[start:start + PAGE_SIZE]
+            page.extend(ZERO_PAGE[len(page):])
+            self.pages[start >> PAGE_BITS] = page
+        self.owned = set(self.pages)  # pages nobody else can see
+
+    @classmethod
+    def from_words(cls, words):
+        """
+        Builds memory from a buffer of native 64-bit words
+        (such as a memoryview cast to 'q'), one page slice at a time.
+        """
+        memory = cls()
+        memory.length = len(words)
+        for start in range(0, len(words), PAGE_SIZE):
+            page = words[start:start + PAGE_SIZE].tolist()
+            page.extend(ZERO_PAGE[len(page):])
+            memory.pages[start >> PAGE_BITS] = page
+        memory.owned = set(memory.pages)
+        return memory
+
+    def __getitem__(self, index):
+        try:
+            return self.pages[index >> PAGE_BITS][index & PAGE_MASK]
+        except TypeError:
+            raise bad_address(index)
+
+    def __setitem__(self, index, value):
+        try:
+            n = index >> PAGE_BITS
+        except TypeError:
+            raise bad_address(index)
+        if n in self.owned:
+            page = self.pages[n]
+        else:
+            if n < 0:
+                raise bad_address(index)
+            watches = self.watched.get(n)
+            if watches:
+                self.write_watched(index, value, watches)
+                return
+            # first write: allocate, or copy a page shared with a fork
+            page = self.pages[n] = list(self.pages[n])
+            self.owned.add(n)
+        page[index & PAGE_MASK] = value
+        if index >= self.length:
+            self.length = index + 1
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for start in range(0, self.length, PAGE_SIZE):
+            page = self.pages[start >> PAGE_BITS]
+            yield from page[:min(PAGE_SIZE, self.length - start)]
+
+    def __eq__(self, other):
+        try:
+            return len(self) == len(other) and list(self) == list(other)
+        except TypeError:
+            return False
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def fork(self):
+        """
+        Returns a memory with the same contents that shares all pages with
+        this one until either side writes to them.
+        """
+        child = self.__class__.__new__(self.__class__)
+        child.length = self.length
+        child.owned = set()
+        if not self.owned and not self.owned_watched and self.pages.base is not None:
+            # nothing written since our last fork: our table only caches its base
+            child.pages = PageTable(base=self.pages.base, zero=self.ZERO)
+            return child
+        base = self.pages
+        if base.depth >= self.MAX_DEPTH:
+            base = base.flatten()
+        child.pages = PageTable(base=base, zero=self.ZERO)
+        self.pages = PageTable(base=base, zero=self.ZERO)
+        self.owned = set()  # every page is now shared with the child
+        self.owned_watched = frozenset()
+        return child
+
+    def watch(self, start, stop, callback):
+        """
+        Calls callback(address, old, new) after every write to an address
+        in range(start, stop). The pages holding those addresses are kept
+        off the write fast path; writes to any other page cost nothing extra.
+        Watches belong to this memory only, not to its forks.
+        """
+        watched = dict(self.watched)
+        for n in range(start >> PAGE_BITS, ((stop - 1) >> PAGE_BITS) + 1):
+            watched[n] = watched.get(n, ()) + ((start, stop, callback),)
+            if n in self.owned:
+                self.owned.remove(n)
+                self.owned_watched |= {n}
+        self.watched = watched
+
+    def unwatch(self, callback):
+        """ Removes every watch that calls `callback`. """
+        watched = {}
+        for n, watches in self.watched.items():
+            watches = tuple(w for w in watches if w[2] is not callback)
+            if watches:
+                watched[n] = watches
+        self.watched = watched
+        # pages nobody watches any more go back on the fast path
+        for n in self.owned_watched.difference(watched):
+            self.owned.add(n)
+        self.owned_watched = self.owned_watched.intersection(watched)
+
+    def watches(self):
+        """ Every (start, stop, callback) currently watched. """
+        found = []
+        for watches in self.watched.values():
+            for w in watches:
+                if w not in found:
+                    found.append(w)
+        return found
+
+    def write_watched(self, index, value, watches):
+        old = self[index]
+        n = index >> PAGE_BITS
+        watched = self.watched
+        self.watched = {}
+        if n in self.owned_watched:
+            self.owned.add(n)  # already ours: write in place
+        try:
+            self[index] = value  # otherwise the usual slow path copies the page
+        finally:
+            self.watched = watched
+            if n in self.owned:
+                self.owned.remove(n)
+                if n not in self.owned_watched:
+                    self.owned_watched |= {n}
+        for start, stop, callback in watches:
+            if start <= index < stop:
+                callback(index, old, value)
+
+    def page_count(self):
+        """ Number of distinct pages in use (written to, or shared with a fork). """
+        return len(self.pages.flatten())
+
+    def copy(self):
+        return self.fork()
+
+    def tolist(self):
+        return list(self)
+
+
+# Marks a cell whose value did not fit in 64 bits and lives in the side table.
+BIG = -(1 << 63)
+
+ZERO_ARRAY = array('q', ZERO_PAGE)
+
+
+class CompactMemory(PagedMemory):
+    """
+    PagedMemory whose pages are array('q') of native 64-bit integers:
+    about 4x smaller than lists of boxed ints, and copying a page is a memcpy.
+    Values that overflow 64 bits are promoted to a side table, so big-int
+    results (like day9's) still come out right.
+    """
+    ZERO = ZERO_ARRAY
+
+    def __init__(self, values=()):
+        values = list(values)
+        self.length = len(values)
+        self.pages = PageTable(zero=self.ZERO)
+        self.big = {}  # address -> value too big for its page
+        for start in range(0, len(values), PAGE_SIZE):
+            chunk = values[start:start + PAGE_SIZE]
+            try:
+                if BIG in chunk:
+                    raise OverflowError()
+                page = array('q', chunk)
+                page.extend(ZERO_ARRAY[len(chunk):])
+            except OverflowError:
+                page = ZERO_ARRAY[:]
+                for offset, value in enumerate(chunk):
+                    self.store(page, start + offset, value)
+            self.pages[start >> PAGE_BITS] = page
+        self.owned = set(self.pages)
+
+    @classmethod
+    def from_words(cls, words):
+        """
+        Builds memory from a buffer of native 64-bit words; each page is a
+        straight copy of the buffer. The words must not contain BIG.
+        """
+        memory = cls()
+        memory.length = len(words)
+        for start in range(0, len(words), PAGE_SIZE):
+            page = array('q')
+            page.frombytes(words[start:start + PAGE_SIZE].cast('B'))
+            page.extend(ZERO_ARRAY[len(page):])
+            memory.pages[start >> PAGE_BITS] = page
+        memory.owned = set(memory.pages)
+        return memory
+
+    def store(self, page, index, value):
+        try:
+            if value == BIG:
+                raise OverflowError()
+            page[index & PAGE_MASK] = value
+        except OverflowError:
+            page[index & PAGE_MASK] = BIG
+            self.big[index] = value
+
+    def __getitem__(self, index):
+        try:
+            value = self.pages[index >> PAGE_BITS][index & PAGE_MASK]
+        except TypeError:
+            raise bad_address(index)
+        if value == BIG:
+            return self.big[index]
+        return value
+
+    def __setitem__(self, index, value):
+        try:
+            n = index >> PAGE_BITS
+        except TypeError:
+            raise bad_address(index)
+        if n in self.owned:
+            page = self.pages[n]
+        else:
+            if n < 0:
+                raise bad_address(index)
+            watches = self.watched.get(n)
+            if watches:
+                self.write_watched(index, value, watches)
+                return
+            # first write: allocate, or copy a page shared with a fork
+            page = self.pages[n] = self.pages[n][:]
+            self.owned.add(n)
+        try:
+            if value == BIG:
+                raise OverflowError()
+            page[index & PAGE_MASK] = value
+        except OverflowError:
+            page[index & PAGE_MASK] = BIG
+            self.big[index] = value
+        if index >= self.length:
+            self.length = index + 1
+
+    def __iter__(self):
+        for start in range(0, self.length, PAGE_SIZE):
+            page = self.pages[start >> PAGE_BITS]
+            for offset, value in enumerate(page[:min(PAGE_SIZE, self.length - start)]):
+                yield self.big[start + offset] if value == BIG else value
+
+    def fork(self):
+        child = super(CompactMemory, self).fork()
+        child.big = self.big.copy()  # almost always empty
+        return child
+
+
+if __name__ == '__main__':
+    import sys
+
+    # a write on a watched page must survive unwatch() and the next fork
+    for cls in (PagedMemory, CompactMemory):
+        memory = cls([1, 2, 3, 4])
+        memory.fork()
+        seen = []
+        written = lambda address, old, new: seen.append((address, old, new))
+        memory.watch(0, 4, written)
+        memory[1] = 99
+        memory.unwatch(written)
+        if seen != [(1, 2, 99)] or list(memory.fork()) != [1, 99, 3, 4]:
+            print("[W] {} fork after unwatch lost a write: {}".format(cls.__name__, list(memory.fork())))
+            sys.exit(1)
@@ -0,0 +1,225 @@
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+from shared.checkpoint import loads
+from shared.intcode import IntcodeVM
+from shared.memory import PagedMemory
+from shared.wire import WireClosed
+
+# Header words of a RingWire: values written, values read, closed flag
+HEAD = 0
+TAIL = 1
+CLOSED = 2
+HEADER_WORDS = 3
+
+
+def _backoff(spins):
+    """ Spins briefly, then sleeps for longer and longer (up to 1ms) while a wire stays empty or full. """
+    if spins < 64:
+        time.sleep(0)
+    else:
+        time.sleep(min(0.001, 0.00001 * (spins - 63)))
+
+
+class RingWire(object):
+    """
+    Single-producer / single-consumer FIFO of 64-bit ints in shared memory,
+    for wiring VMs that run in different processes.
+
+    The producer only ever writes a slot and then the head count, the
+    consumer only ever reads a slot and then writes the tail count, so
+    neither side takes a lock. An empty (or full) wire is waited on by
+    spinning, then sleeping with a growing backoff.
+    Offers the same interface as a Wire, so Processors, Connectors and
+    RemoteProcessors can all be attached to it.
+    """
+    def __init__(self, capacity=1024, values=()):
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(create=True, size=(HEADER_WORDS + capacity) * 8)
+        self.owner = True  # the creating process unlinks it
+        self.attach()
+        self.words[HEAD] = self.words[TAIL] = self.words[CLOSED] = 0
+        for value in values:
+            self.put(value)
+
+    def attach(self):
+        self.words = self.shm.buf.cast('q')
+        self.woken = False
+
+    def __getstate__(self):
+        return {"name": self.shm.name, "capacity": self.capacity}
+
+    def __setstate__(self, state):
+        # a spawned process attaching to the parent's wire
+        self.capacity = state["capacity"]
+        self.shm = shared_memory.SharedMemory(name=state["name"])
+        self.owner = False
+        self.attach()
+
+    @property
+    def closed(self):
+        return self.words[CLOSED] != 0
+
+    def qsize(self):
+        return self.words[HEAD] - self.words[TAIL]
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def put(self, value, block=True, timeout=None):
+        words = self.words
+        head = words[HEAD]
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        spins = 0
+        while True:
+            if words[CLOSED]:
+                raise WireClosed()
+            if head - words[TAIL] < self.capacity:
+                break
+            if not block or (deadline is not None and time.perf_counter() > deadline):
+                raise queue.Full()
+            _backoff(spins)
+            spins += 1
+        try:
+            words[HEADER_WORDS + head % self.capacity] = value
+        except (OverflowError, TypeError, ValueError):
+            raise Exception("RingWire only carries 64-bit ints: {!r}".format(value))
+        words[HEAD] = head + 1
+
+    def put_many(self, values):
+        for value in values:
+            self.put(value)
+
+    def get(self, block=True, timeout=None):
+        words = self.words
+        tail = words[TAIL]
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        spins = 0
+        while words[HEAD] == tail:
+            if words[CLOSED] and words[HEAD] == tail:
+                raise WireClosed()
+            if not block or (deadline is not None and time.perf_counter() > deadline):
+                raise queue.Empty()
+            _backoff(spins)
+            spins += 1
+        value = words[HEADER_WORDS + tail % self.capacity]
+        words[TAIL] = tail + 1
+        return value
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def drain(self):
+        values = []
+        while not self.empty():
+            values.append(self.get())
+        return values
+
+    def wait(self, timeout=None):
+        """
+        Blocks until a value is buffered, the wire is closed, or wake() is
+        called in this process. Returns True if there is something to read.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        spins = 0
+        while self.empty() and not self.closed and not self.woken:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            _backoff(spins)
+            spins += 1
+        self.woken = False
+        return not self.empty()
+
+    def wake(self):
+        self.woken = True
+
+    def close(self):
+        self.words[CLOSED] = 1
+
+    def unlink(self):
+        """ Frees the shared memory; call once every process is done with the wire. """
+        self.words.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __del__(self):
+        # the view must go before SharedMemory can close its mapping
+        words = getattr(self, 'words', None)
+        if words is not None:
+            words.release()
+
+
+def _run_remote(code, in_wire, out_wire, engine, id, debug, result):
+    if isinstance(code, bytes):  # a checkpoint
+        vm = loads(code, input=in_wire, output=out_wire, id=id, debug=debug, engine=engine)
+    else:
+        vm = engine(code, input=in_wire, output=out_wire, id=id, debug=debug)
+    try:
+        vm.run()
+    finally:
+        if vm.halted and out_wire is not None:
+            out_wire.close()
+        result.send((list(vm.memory), vm.ip, vm.halted))
+        result.close()
+
+
+class RemoteProcessor(object):
+    """
+    Counterpart of Processor that runs its VM in a process of its own, so
+    a network of CPU-bound VMs is not limited to one core by the GIL.
+    Takes the same arguments and is wired up the same way, with RingWires
+    between processes; once joined, `memory` holds the VM's final memory.
+    Listeners run in the parent process, from join().
+    `code` can also be a checkpoint (see shared.checkpoint.dumps), to
+    start the process from a warm VM instead of from instruction zero.
+    """
+    def __init__(self, id, code,
+                 in_wire=None, out_wire=None, debug=False, engine=IntcodeVM):
+        self.id = id
+        self.in_wire = in_wire
+        self.out_wire = out_wire
+        self.debug = debug
+        self.listeners = []
+        self.joined = False
+        self.memory = None
+        self.ip = None
+        self.halted = False
+        self.result, self.sender = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(name='RemoteProc <{id}>'.format(id=id),
+            target=_run_remote,
+            args=(code if isinstance(code, bytes) else list(code),
+                  in_wire, out_wire, engine, str(self), debug, self.sender))
+
+        if self.debug:
+            print('{self}: Initialized'.format(**locals()))
+
+    def __str__(self):
+        return 'RemoteProc [{id}]'.format(id=self.id)
+
+    def start(self):
+        self.process.start()
+        self.sender.close()  # only the child writes; recv() sees EOF if it dies
+
+    def join(self):
+        if not self.joined:
+            self.joined = True
+            try:
+                memory, self.ip, self.halted = self.result.recv()
+                self.memory = PagedMemory(memory)
+            except EOFError:
+                pass  # the process died without reporting
+            self.process.join()
+            if self.debug:
+                print('{self}: Stopped'.format(**locals()))
+            for li in self.listeners:
+                li()
+
+    def abort(self):
+        print('{self}: ABORT'.format(**locals()))
+        self.process.terminate()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
@@ -0,0 +1,87 @@
+import queue
+import threading
+import traceback
+
+
+class Pooled(object):
+    """
+    Handle to a Processor or Connector running on a pool thread.
+    join() waits for its run() to return, like Thread.join().
+    """
+    def __init__(self, target):
+        self.target = target
+        self.done = threading.Event()
+
+    def __str__(self):
+        return str(self.target)
+
+    def run(self):
+        try:
+            self.target.run()
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            self.done.set()
+
+    def join(self, timeout=None):
+        self.done.wait(timeout)
+
+    def is_alive(self):
+        return not self.done.is_set()
+
+
+class ProcessorPool(object):
+    """
+    Threads that outlive the networks they run.
+
+    Processors and Connectors are threads, but their run() works on any
+    thread: start() hands it to an idle pool thread instead of spawning a
+    new one, so a search that builds and runs thousands of circuits does not
+    create and tear down threads for each. Every member of a network blocks
+    on its wires at the same time, so the pool never makes them wait for a
+    free thread: it grows to the largest network run at once and keeps those
+    threads for the next one.
+    """
+    def __init__(self):
+        self.jobs = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.idle = 0
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self, target):
+        """ Runs target.run() on a pool thread; returns its Pooled handle. """
+        handle = Pooled(target)
+        with self.lock:
+            if self.idle:
+                self.idle -= 1
+            else:
+                worker = threading.Thread(name='Pool <{}>'.format(len(self.workers)),
+                    target=self.work, daemon=True)
+                self.workers.append(worker)
+                worker.start()
+        self.jobs.put(handle)
+        return handle
+
+    def work(self):
+        while True:
+            handle = self.jobs.get()
+            if handle is None:
+                return
+            handle.run()
+            with self.lock:
+                self.idle += 1
+
+    def close(self):
+        """ Stops the pool threads once they are done with what they are running. """
+        for _ in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.idle = 0
@@ -0,0 +1,121 @@
+from collections import deque
+
+
+class ListPort(object):
+    """
+    In-memory port backed by a deque: get() takes from the front, put()
+    appends to the back, both O(1). A plain list handed to a VM as its
+    input is copied into one of these when the VM starts.
+    """
+    def __init__(self, values=()):
+        self.values = deque(values)
+
+    def get(self):
+        try:
+            return self.values.popleft()
+        except IndexError:
+            raise Exception("Cannot read from input: no values left")
+
+    def put(self, value):
+        self.values.append(value)
+
+
+class QueuePort(object):
+    """ Port over anything with a blocking get() / put(), e.g. a queue.Queue or a Wire. """
+    def __init__(self, queue):
+        self.queue = queue
+
+    def get(self):
+        return self.queue.get()
+
+    def put(self, value):
+        self.queue.put(value)
+
+
+class CallbackPort(object):
+    """ Port whose reads call get() and whose writes call put(value). """
+    def __init__(self, get=None, put=None):
+        if get is not None:
+            self.get = get
+        if put is not None:
+            self.put = put
+
+    def get(self):
+        raise Exception("Cannot read from input: no callback")
+
+    def put(self, value):
+        raise Exception("Cannot write to output: no callback")
+
+
+class AsciiPort(object):
+    """
+    Port for ASCII-speaking programs.
+    As an input, it hands out the characters of the lines given to it
+    (or to write_line()) one at a time, each line ended by a newline.
+    As an output, it decodes characters into `lines` as each newline arrives;
+    values outside the ASCII range go to `values` instead.
+    """
+    def __init__(self, lines=()):
+        self.pending = deque()
+        self.chars = []
+        self.lines = []
+        self.values = []
+        for line in lines:
+            self.write_line(line)
+
+    def write_line(self, line):
+        self.pending.extend(map(ord, line))
+        self.pending.append(ord('\n'))
+
+    def get(self):
+        try:
+            return self.pending.popleft()
+        except IndexError:
+            raise Exception("Cannot read from input: no characters left")
+
+    def put(self, value):
+        if not 0 <= value < 128:
+            self.values.append(value)
+        elif value == 10:
+            self.lines.append(''.join(self.chars))
+            self.chars = []
+        else:
+            self.chars.append(chr(value))
+
+    def text(self):
+        """ Everything decoded so far, including an unfinished last line. """
+        return ''.join(line + '\n' for line in self.lines) + ''.join(self.chars)
+
+
+def _not_connected(kind):
+    def fail(*args):
+        raise Exception("{} not connected".format(kind))
+    return fail
+
+
+def bind_input(port):
+    """
+    Returns a function that reads one value from `port`: None, a list
+    (read front to back), or anything with a get() method.
+    """
+    if port is None:
+        return _not_connected("Input")
+    if isinstance(port, list):
+        return ListPort(port).get
+    if hasattr(port, 'get'):
+        return port.get
+    raise Exception("Cannot read from input: {!r}".format(port))
+
+
+def bind_output(port):
+    """
+    Returns a function that writes one value to `port`: None, or
+    anything with a put() method, or failing that an append() method.
+    """
+    if port is None:
+        return _not_connected("Output")
+    if hasattr(port, 'put'):
+        return port.put
+    if hasattr(port, 'append'):
+        return port.append
+    raise Exception("Cannot write to output: {!r}".format(port))
@@ -0,0 +1,77 @@
+import time
+from collections import Counter, deque
+
+NAMES = {
+    1: 'ADD',
+    2: 'MULT',
+    3: 'INPUT',
+    4: 'OUTPT',
+    5: 'JMP IF TRUE',
+    6: 'JMP IF FALSE',
+    7: 'LESS THAN',
+    8: 'EQUALS',
+    9: 'ADJ REL_BASE',
+    99: 'HALT',
+}
+
+IO_OPCODES = (3, 4)
+
+
+class Profiler(object):
+    """
+    Opt-in instrumentation for an IntcodeVM.
+
+    Counts executed opcodes and addresses, sums the time spent blocked on
+    I/O and keeps the last `trace_size` decoded instructions in a ring buffer,
+    which the VM dumps if the program crashes.
+    Handlers are wrapped as the VM decodes them, so only the cached decodings
+    of a profiled VM carry the timing and counting; an unprofiled VM's
+    cache holds the plain handlers.
+    """
+    def __init__(self, trace_size=32):
+        self.trace_size = trace_size
+        self.opcodes = Counter()    # opcode -> times executed
+        self.addresses = Counter()  # ip -> times executed
+        self.io_wait = 0.0          # seconds spent inside input/output
+        self.trace = deque(maxlen=trace_size)
+
+    def record(self, memory, ip, opcode, modes):
+        self.opcodes[opcode] += 1
+        self.addresses[ip] += 1
+        self.trace.append((ip, opcode, modes, (memory[ip + 1], memory[ip + 2], memory[ip + 3])))
+
+    def wrap(self, opcode, handler):
+        """ Returns `handler`, instrumented. """
+        profiler = self
+        if opcode in IO_OPCODES:
+            def profiled(vm, ip, modes):
+                profiler.record(vm.memory, ip, opcode, modes)
+                start = time.perf_counter()
+                try:
+                    return handler(vm, ip, modes)
+                finally:
+                    profiler.io_wait += time.perf_counter() - start
+        else:
+            def profiled(vm, ip, modes):
+                profiler.record(vm.memory, ip, opcode, modes)
+                return handler(vm, ip, modes)
+        return profiled
+
+    def hottest(self, n=10):
+        """ The `n` most executed addresses, as (ip, count) pairs. """
+        return self.addresses.most_common(n)
+
+    def report(self):
+        return {
+            "instructions": sum(self.opcodes.values()),
+            "opcodes": {NAMES.get(op, op): count for op, count in self.opcodes.most_common()},
+            "addresses": dict(self.addresses),
+            "io_wait": self.io_wait,
+            "trace": list(self.trace),
+        }
+
+    def dump_trace(self):
+        print("Last {} instructions:".format(len(self.trace)))
+        for ip, opcode, modes, params in self.trace:
+            print("  #{ip} {name} modes={modes} params={params}".format(
+                name=NAMES.get(opcode, opcode), **locals()))
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+
+from shared.image import image_digest
+from shared.intcode import IntcodeVM, NEEDS_INPUT, HALTED
+from shared.ports import bind_output
+
+# Residuals kept for reuse; the least recently used go first.
+MAX_RESIDUALS = 256
+
+# (engine, program digest, known inputs) -> Residual
+_residuals = OrderedDict()
+
+
+class Residual(object):
+    """
+    What is left of a program once its first inputs are known: the state
+    of a VM paused right where it asks for the first unknown input, and
+    anything it output before that. Starting from here skips everything
+    the program does with the known inputs (day7's phase handling, say).
+    """
+    def __init__(self, engine, snapshot, outputs):
+        self.engine = engine
+        self.snapshot = snapshot
+        self.outputs = tuple(outputs)
+
+    @classmethod
+    def run_prefix(cls, program, prefix, engine=IntcodeVM):
+        vm = engine(program)
+        outputs = []
+        pending = list(reversed(prefix))
+        io = vm.execute()
+        event, value = next(io)
+        while event != HALTED:
+            if event == NEEDS_INPUT:
+                if not pending:
+                    break
+                event, value = io.send(pending.pop())
+            else:
+                outputs.append(value)
+                event, value = next(io)
+        io.close()  # leaves vm.ip on the input instruction
+        return cls(engine, vm.snapshot(), outputs)
+
+    @property
+    def halted(self):
+        """ True if the program finished within the known inputs. """
+        return self.snapshot["halted"]
+
+    def vm(self, input=None, output=None, id='_', debug=False, profile=False):
+        """
+        Returns a VM that carries on from here with the given ports.
+        The outputs the program made during the known inputs are written
+        to `output` first, so the caller sees the same stream as a full run.
+        """
+        vm = self.engine(self.snapshot["memory"],
+            input=input, output=output, id=id, debug=debug, profile=profile)
+        vm.restore(self.snapshot)
+        if self.outputs:
+            write = bind_output(output)
+            for value in self.outputs:
+                write(value)
+        return vm
+
+
+def specialize(program, prefix, engine=IntcodeVM):
+    """
+    Returns the Residual of `program` for the known leading inputs `prefix`.
+    The last MAX_RESIDUALS residuals are cached per (engine, program, prefix),
+    so a search that keeps starting the program with the same inputs only
+    runs that part once.
+    """
+    key = (engine, image_digest(program), tuple(prefix))
+    try:
+        residual = _residuals[key]
+        _residuals.move_to_end(key)
+        return residual
+    except KeyError:
+        residual = _residuals[key] = Residual.run_prefix(program, prefix, engine=engine)
+        while len(_residuals) > MAX_RESIDUALS:
+            _residuals.popitem(last=False)
+        return residual
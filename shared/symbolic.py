@@ -0,0 +1,312 @@
+import functools
+import itertools
+
+from shared.intcode import IntcodeVM
+from shared.batch import find_first
+
+
+def _cell(address, endState):
+    return endState["memory"][address]
+
+
+class SymbolicBranch(Exception):
+    """ Raised when control flow (or a write address) depends on a symbol. """
+    pass
+
+
+class Unknown(object):
+    """
+    A value the symbolic VM cannot track, such as a load from a symbolic
+    address. Anything computed from it is Unknown too; it only becomes a
+    problem if it ends up in the result or steers control flow.
+    """
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __repr__(self):
+        return '<unknown: {}>'.format(self.reason)
+
+    def _absorb(self, other):
+        return self
+
+    __add__ = __radd__ = __mul__ = __rmul__ = _absorb
+
+
+def terms_of(value):
+    if isinstance(value, Poly):
+        return value.terms
+    return {(): value} if value != 0 else {}
+
+
+def make(terms):
+    """ Polynomial from { monomial: coefficient }; constants come out as plain ints. """
+    terms = {m: c for m, c in terms.items() if c != 0}
+    if not terms:
+        return 0
+    if list(terms) == [()]:
+        return terms[()]
+    return Poly(terms)
+
+
+class Poly(object):
+    """
+    Polynomial with integer coefficients over named variables.
+    A monomial is a sorted tuple of (variable, power) pairs; () is the constant.
+    """
+    def __init__(self, terms):
+        self.terms = terms
+
+    @staticmethod
+    def var(name):
+        return Poly({((name, 1),): 1})
+
+    def __add__(self, other):
+        if isinstance(other, Unknown):
+            return NotImplemented
+        terms = dict(self.terms)
+        for m, c in terms_of(other).items():
+            terms[m] = terms.get(m, 0) + c
+        return make(terms)
+
+    __radd__ = __add__
+
+    def __mul__(self, other):
+        if isinstance(other, Unknown):
+            return NotImplemented
+        terms = {}
+        for m1, c1 in self.terms.items():
+            for m2, c2 in terms_of(other).items():
+                powers = dict(m1)
+                for name, power in m2:
+                    powers[name] = powers.get(name, 0) + power
+                m = tuple(sorted(powers.items()))
+                terms[m] = terms.get(m, 0) + c1 * c2
+        return make(terms)
+
+    __rmul__ = __mul__
+
+    def __repr__(self):
+        parts = []
+        for m, c in sorted(self.terms.items(), key=lambda t: (-len(t[0]), t[0])):
+            names = '*'.join(name if power == 1 else '{}^{}'.format(name, power) for name, power in m)
+            if not names:
+                parts.append(str(c))
+            elif c == 1:
+                parts.append(names)
+            else:
+                parts.append('{}*{}'.format(c, names))
+        return ' + '.join(parts)
+
+    def variables(self):
+        return {name for m in self.terms for name, _ in m}
+
+    def degree(self, name):
+        return max(dict(m).get(name, 0) for m in self.terms)
+
+    def evaluate(self, values):
+        """ Value of the polynomial for { variable: int }. """
+        result = 0
+        for m, c in self.terms.items():
+            for name, power in m:
+                c *= values[name] ** power
+            result += c
+        return result
+
+    def split(self, name):
+        """
+        For a polynomial of degree 1 in `name`, returns (a, b) such that
+        self == a * name + b, where neither a nor b mention `name`.
+        """
+        a, b = {}, {}
+        for m, c in self.terms.items():
+            powers = dict(m)
+            if powers.pop(name, 0):
+                a[tuple(sorted(powers.items()))] = c
+            else:
+                b[m] = c
+        return make(a), make(b)
+
+
+def evaluate(value, values):
+    return value.evaluate(values) if isinstance(value, Poly) else value
+
+
+def is_concrete(value):
+    return isinstance(value, int)
+
+
+class SymbolicVM(IntcodeVM):
+    """
+    IntcodeVM whose memory cells (and inputs) may hold Poly values.
+    Arithmetic on symbols builds polynomials; a jump, relative base change,
+    write address or instruction that depends on a symbol raises SymbolicBranch.
+    """
+    def run(self):
+        """
+        Same loop as IntcodeVM.run(), minus the crash report:
+        SymbolicBranch is an expected way for a symbolic run to end.
+        """
+        if self.halted:
+            return self
+        decoded = self.decoded
+        ip = self.ip
+        try:
+            while not self.stopped:
+                try:
+                    opcode, modes, handler = decoded[ip]
+                except KeyError:
+                    opcode, modes, handler = self.predecode(ip)
+                if handler is None:  # halt
+                    ip += 1
+                    self.halted = True
+                    break
+                ip = handler(self, ip, modes)
+        finally:
+            self.ip = ip
+        return self
+
+    def predecode(self, ip):
+        if not is_concrete(self.memory[ip]):
+            raise SymbolicBranch("Symbolic instruction at #{}".format(ip))
+        return super(SymbolicVM, self).predecode(ip)
+
+    def read(self, parameter, mode):
+        if mode == 1:  # immediate mode
+            return parameter
+        if mode == 0:  # position mode
+            address = parameter
+        elif mode == 2:  # relative mode
+            address = self.relative_base + parameter
+        else:
+            raise Exception("Unknown parameter mode: {}".format(mode))
+        if not is_concrete(address):
+            return Unknown('load from {}'.format(address))
+        return self.memory[address]
+
+    def write_to_param(self, ip, index, modes, output):
+        if not is_concrete(self.memory[ip + index]):
+            raise SymbolicBranch("Symbolic write address at #{}".format(ip))
+        super(SymbolicVM, self).write_to_param(ip, index, modes, output)
+
+    def op_jump_if_true(self, ip, modes):
+        return self.jump(ip, modes, lambda p1: p1 != 0)
+
+    def op_jump_if_false(self, ip, modes):
+        return self.jump(ip, modes, lambda p1: p1 == 0)
+
+    def jump(self, ip, modes, taken):
+        p1 = self.read_param(ip, 1, modes)
+        p2 = self.read_param(ip, 2, modes)
+        if not is_concrete(p1):
+            raise SymbolicBranch("Symbolic jump condition at #{}".format(ip))
+        if not taken(p1):
+            return ip + 3
+        if not is_concrete(p2):
+            raise SymbolicBranch("Symbolic jump target at #{}".format(ip))
+        return p2
+
+    def op_less_than(self, ip, modes):
+        return self.compare(ip, modes, super(SymbolicVM, self).op_less_than)
+
+    def op_equals(self, ip, modes):
+        return self.compare(ip, modes, super(SymbolicVM, self).op_equals)
+
+    def compare(self, ip, modes, concrete):
+        p1 = self.read_param(ip, 1, modes)
+        p2 = self.read_param(ip, 2, modes)
+        if is_concrete(p1) and is_concrete(p2):
+            return concrete(ip, modes)
+        # only a problem if something branches on it later
+        self.write_to_param(ip, 3, modes, Unknown('comparison at #{}'.format(ip)))
+        return ip + 4
+
+    def op_adjust_relative_base(self, ip, modes):
+        if not is_concrete(self.read_param(ip, 1, modes)):
+            raise SymbolicBranch("Symbolic relative base at #{}".format(ip))
+        return super(SymbolicVM, self).op_adjust_relative_base(ip, modes)
+
+
+def symbolic_cell(memory, symbols, address=0):
+    """
+    Runs the program once with the cells in `symbols` ({ address: name })
+    holding variables. Returns the value left at `address`: an int, a Poly,
+    or an Unknown. Raises SymbolicBranch if control flow depends on a symbol.
+    """
+    memory = list(memory)
+    for cell, name in symbols.items():
+        memory[cell] = Poly.var(name)
+    vm = SymbolicVM(memory)
+    vm.run()
+    return vm.memory[address]
+
+
+def solve(expr, target, domains):
+    """
+    Finds the first assignment, in the order the domains iterate
+    ({ variable: range }, first variable outermost), for which expr == target.
+    The innermost variable is solved for directly when expr is linear in it;
+    the others are enumerated. Returns { variable: value } or None.
+    """
+    names = list(domains)
+    inner = names[-1]
+    outer = names[:-1]
+
+    if isinstance(expr, Poly) and expr.degree(inner) <= 1:
+        a, b = expr.split(inner)
+        for values in itertools.product(*(domains[n] for n in outer)):
+            assignment = dict(zip(outer, values))
+            ai = evaluate(a, assignment)
+            bi = evaluate(b, assignment)
+            if ai == 0:
+                candidates = domains[inner] if bi == target else ()
+            elif (target - bi) % ai == 0:
+                candidates = [(target - bi) // ai] if (target - bi) // ai in domains[inner] else ()
+            else:
+                candidates = ()
+            for value in candidates:
+                assignment[inner] = value
+                return assignment
+        return None
+
+    for values in itertools.product(*(domains[n] for n in names)):
+        assignment = dict(zip(names, values))
+        if evaluate(expr, assignment) == target:
+            return assignment
+    return None
+
+
+def find_inputs(memory, cells, target, address=0, processes=None):
+    """
+    Finds values for the memory cells in `cells` ({ address: range }) that
+    leave `target` at `address` once the program halts, e.g. day2's noun/verb.
+    Returns { cell address: value } for the first match in iteration order,
+    or None.
+
+    One symbolic run turns the result into a polynomial that is solved
+    directly; if control flow depends on the inputs (or the result cannot be
+    tracked) it falls back to a concrete search over a process pool.
+    """
+    symbols = {cell: '@{}'.format(cell) for cell in cells}
+    domains = {symbols[cell]: domain for cell, domain in cells.items()}
+    try:
+        expr = symbolic_cell(memory, symbols, address=address)
+    except SymbolicBranch:
+        expr = None
+
+    if expr is not None and not isinstance(expr, Unknown):
+        assignment = solve(expr, target, domains)
+        if assignment is None:
+            return None
+        return {cell: assignment[symbols[cell]] for cell in cells}
+
+    jobs = [
+        (dict(zip(cells, values)), None)
+        for values in itertools.product(*cells.values())
+    ]
+    # only the cell we are after comes back from the workers
+    match = find_first(memory, jobs, lambda value: value == target,
+        processes=processes, extract=functools.partial(_cell, address))
+    if match is None:
+        return None
+    _, (patch, _), _ = match
+    return patch
@@ -0,0 +1,194 @@
+import json
+import sys
+import threading
+import time
+
+from shared.wire import Wire
+
+
+class MeteredWire(Wire):
+    """
+    Wire that counts what goes through it: values in and out, and the
+    peak and time-weighted mean number of values left waiting in it.
+    A wire that stays full is a stage whose consumer cannot keep up.
+    """
+    def __init__(self, name, values=(), capacity=None):
+        super(MeteredWire, self).__init__(values, capacity)
+        self.name = name
+        self.put_count = len(self.buffer)
+        self.get_count = 0
+        self.peak_depth = len(self.buffer)
+        self.depth_time = 0.0  # integral of depth over time
+        self.created = self.changed = time.perf_counter()
+        self.meter = threading.Lock()
+
+    def moved(self, added=0, taken=0):
+        with self.meter:
+            now = time.perf_counter()
+            depth = len(self.buffer)
+            # the depth before this move held since the last one
+            self.depth_time += (depth - added + taken) * (now - self.changed)
+            self.changed = now
+            self.put_count += added
+            self.get_count += taken
+            if depth > self.peak_depth:
+                self.peak_depth = depth
+
+    def put(self, value, block=True, timeout=None):
+        super(MeteredWire, self).put(value, block, timeout)
+        self.moved(added=1)
+
+    def put_many(self, values):
+        values = list(values)
+        super(MeteredWire, self).put_many(values)
+        self.moved(added=len(values))
+
+    def get(self, block=True, timeout=None):
+        value = super(MeteredWire, self).get(block, timeout)
+        self.moved(taken=1)
+        return value
+
+    def drain(self):
+        values = super(MeteredWire, self).drain()
+        self.moved(taken=len(values))
+        return values
+
+    def report(self):
+        with self.meter:
+            now = time.perf_counter()
+            depth = len(self.buffer)
+            depth_time = self.depth_time + depth * (now - self.changed)
+            elapsed = now - self.created
+            return {
+                "put": self.put_count,
+                "transferred": self.get_count,
+                "depth": depth,
+                "peak_depth": self.peak_depth,
+                "mean_depth": depth_time / elapsed if elapsed > 0 else float(depth),
+            }
+
+
+class VMStats(object):
+    """
+    Per-VM counters: values read and written, and how the VM's wall time
+    splits between waiting on its input, waiting on its output and executing.
+    Works by swapping the VM's bound read_input / write_output for timed
+    wrappers, so the cost is paid per value read or written, never per
+    instruction executed.
+    """
+    def __init__(self, id):
+        self.id = id
+        self.values_in = 0
+        self.values_out = 0
+        self.blocked_in = 0.0
+        self.blocked_out = 0.0
+        self.started = None
+        self.stopped = None
+
+    def attach(self, vm):
+        read_input = vm.read_input
+        write_output = vm.write_output
+        stats = self
+
+        def metered_read():
+            start = time.perf_counter()
+            try:
+                value = read_input()
+            finally:
+                stats.blocked_in += time.perf_counter() - start
+            stats.values_in += 1
+            return value
+
+        def metered_write(value):
+            start = time.perf_counter()
+            try:
+                write_output(value)
+            finally:
+                stats.blocked_out += time.perf_counter() - start
+            stats.values_out += 1
+
+        vm.read_input = metered_read
+        vm.write_output = metered_write
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def stop(self):
+        self.stopped = time.perf_counter()
+
+    def report(self):
+        if self.started is None:
+            wall = 0.0
+        else:
+            wall = (self.stopped or time.perf_counter()) - self.started
+        return {
+            "values_in": self.values_in,
+            "values_out": self.values_out,
+            "blocked_in": self.blocked_in,
+            "blocked_out": self.blocked_out,
+            "executing": max(0.0, wall - self.blocked_in - self.blocked_out),
+            "running": self.started is not None and self.stopped is None,
+        }
+
+
+class Telemetry(object):
+    """
+    Collects the counters of a network of Processors and wires.
+    Hand it to the code that builds the network (e.g. day7's create_circuit),
+    then read snapshot() once it has run, or have report_every() write a
+    JSON line every so often while it runs.
+    """
+    def __init__(self):
+        self.created = time.perf_counter()
+        self.wires = {}  # name -> MeteredWire
+        self.vms = {}    # id -> VMStats
+        self.reporter = None
+
+    def wire(self, name, values=(), capacity=None):
+        """ Returns a new MeteredWire, reported under `name`. """
+        wire = self.wires[name] = MeteredWire(name, values, capacity)
+        return wire
+
+    def vm(self, id, vm):
+        """ Meters `vm`'s I/O; returns its VMStats, reported under `id`. """
+        stats = self.vms[id] = VMStats(id)
+        stats.attach(vm)
+        return stats
+
+    def snapshot(self):
+        return {
+            "elapsed": time.perf_counter() - self.created,
+            "vms": {str(id): stats.report() for id, stats in self.vms.items()},
+            "wires": {name: wire.report() for name, wire in self.wires.items()},
+        }
+
+    def bottleneck(self):
+        """ The id of the VM that has spent the most time executing, or None. """
+        vms = self.snapshot()["vms"]
+        if not vms:
+            return None
+        return max(vms, key=lambda id: vms[id]["executing"])
+
+    def json_line(self):
+        return json.dumps(self.snapshot(), sort_keys=True)
+
+    def report_every(self, interval, out=None):
+        """ Writes a JSON line to `out` (stdout) every `interval` seconds, until stop_reporting(). """
+        self.stop_reporting()
+        out = out or sys.stdout
+        stop = threading.Event()
+
+        def report():
+            while not stop.wait(interval):
+                out.write(self.json_line() + '\n')
+                out.flush()
+
+        self.reporter = (stop, threading.Thread(name='Telemetry', target=report, daemon=True))
+        self.reporter[1].start()
+
+    def stop_reporting(self):
+        if self.reporter is not None:
+            stop, thread = self.reporter
+            stop.set()
+            thread.join()
+            self.reporter = None
@@ -0,0 +1,119 @@
+import queue
+import threading
+from collections import deque
+
+
+class WireClosed(Exception):
+    """ Raised by get() on a closed wire with nothing left to read, and by put() on a closed wire. """
+    pass
+
+
+class Wire(object):
+    """
+    A thread-safe FIFO between processors, usable wherever a queue.Queue is.
+
+    Consumers sleep until a value arrives, then wake right away: there is
+    no polling interval. Buffered values can be moved in bulk with drain()
+    and put_many(), taking the lock once per batch instead of once per value.
+    The producer close()s the wire when it is done (a Processor does so when
+    its VM halts): readers get what is still buffered, then WireClosed.
+
+    With a `capacity`, a put() to a full wire blocks until the consumer
+    takes something, so a producer can't run ahead of its consumer and the
+    wire never holds more than `capacity` values (beyond the initial ones).
+    """
+    def __init__(self, values=(), capacity=None):
+        self.buffer = deque(values)
+        self.capacity = capacity
+        self.closed = False
+        lock = threading.Lock()
+        self.not_empty = threading.Condition(lock)
+        self.not_full = threading.Condition(lock)
+
+    def qsize(self):
+        return len(self.buffer)
+
+    def empty(self):
+        return not self.buffer
+
+    def full(self):
+        return self.capacity is not None and len(self.buffer) >= self.capacity
+
+    def wait_for_room(self, block, timeout):
+        # called with the lock held
+        while True:
+            if self.closed:
+                raise WireClosed()
+            if not self.full():
+                return
+            if not block or not self.not_full.wait(timeout):
+                raise queue.Full()
+
+    def put(self, value, block=True, timeout=None):
+        with self.not_empty:
+            self.wait_for_room(block, timeout)
+            self.buffer.append(value)
+            self.not_empty.notify()
+
+    def put_many(self, values):
+        with self.not_empty:
+            if self.capacity is None:
+                if self.closed:
+                    raise WireClosed()
+                self.buffer.extend(values)
+                self.not_empty.notify_all()
+                return
+            values = list(values)
+            while values:
+                self.wait_for_room(True, None)
+                room = self.capacity - len(self.buffer)
+                self.buffer.extend(values[:room])
+                del values[:room]
+                self.not_empty.notify_all()
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            while not self.buffer:
+                if self.closed:
+                    raise WireClosed()
+                if not block or not self.not_empty.wait(timeout):
+                    raise queue.Empty()
+            self.not_full.notify()
+            return self.buffer.popleft()
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def drain(self):
+        """ Takes every buffered value at once, without blocking. """
+        with self.not_empty:
+            values = list(self.buffer)
+            self.buffer.clear()
+            self.not_full.notify_all()
+            return values
+
+    def wait(self, timeout=None):
+        """
+        Blocks until a value is buffered, the wire is closed, or someone
+        calls wake(). Returns True if there is something to read.
+        """
+        with self.not_empty:
+            if not self.buffer and not self.closed:
+                self.not_empty.wait(timeout)
+            return bool(self.buffer)
+
+    def wake(self):
+        """
+        Makes every thread in wait() return, so it can check its own stop
+        flag (see Connector.disconnect). Threads blocked in get() keep
+        waiting for a value; close() the wire to end those.
+        """
+        with self.not_empty:
+            self.not_empty.notify_all()
+
+    def close(self):
+        """ Also wakes producers blocked on a full wire; their put() raises WireClosed. """
+        with self.not_empty:
+            self.closed = True
+            self.not_empty.notify_all()
+            self.not_full.notify_all()